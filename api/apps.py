@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Memory-map the persisted chatbot index, if present; the encoder stays untouched here
+        from .chatbot.index import preload_index
+        preload_index()
@@ -0,0 +1,208 @@
+# Async (ASGI-native) versions of the hot read endpoints.
+# Served under api/async/ with the same responses as their DRF counterparts in views.py;
+# under uvicorn/daphne they run on the event loop instead of hopping through sync_to_async.
+import json
+import logging
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .chatbot.conf import chatbot_setting
+from .chatbot.executor import ExecutorBusy, ExecutorFailed, ExecutorTimeout, get_executor
+from .chatbot.service import answer_questions
+from .catalogue import (
+    CATALOGUE_PAGE_TIMEOUT, acatalogue_version, catalogue_page, catalogue_page_query, catalogue_validators,
+    not_modified, set_validators, wants_status,
+)
+from .chat_summaries import mark_read
+from .history import message_history_page, message_history_query
+from .inbox import inbox_page, inbox_page_query, inbox_queryset
+from .models import ChatRoom, Quiz
+from .notifications import RoomWaiter
+from .quiz_status import with_user_status
+from .rooms import find_direct_room
+from .serializers import ChatbotSerializer, QuizSerializer, QuizWithStatusSerializer
+
+logger = logging.getLogger(__name__)
+
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_MAX_TIMEOUT = 60
+# Waiters are only woken by messages sent through this process, so re-check the
+# database this often in case another process stored one
+LONG_POLL_RECHECK = 5
+
+
+def _json(data, status=200, **kwargs):
+    # DRF's encoder handles datetimes and decimals the same way the DRF views do
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder, **kwargs)
+
+async def _authenticate(request):
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+def _unauthorized():
+    return _json({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+@csrf_exempt
+@require_POST
+async def chatbot(request):
+    if await _authenticate(request) is None:
+        return _unauthorized()
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json({'detail': 'JSON parse error.'}, status=400)
+    serializer = ChatbotSerializer(data=data)
+    if not serializer.is_valid():
+        return _json(serializer.errors, status=400)
+
+    options = serializer.validated_data
+    try:
+        results = await get_executor().arun(
+            answer_questions, [options['question']], options['k'], options['min_score'], options['mode'],
+        )
+    except ExecutorBusy:
+        response = _json({'detail': 'The chatbot is busy, please try again shortly.'}, status=429)
+        response['Retry-After'] = str(chatbot_setting('CHATBOT_EXECUTOR_RETRY_AFTER'))
+        return response
+    except ExecutorTimeout:
+        return _json({'detail': 'The chatbot took too long to answer.'}, status=503)
+    except ExecutorFailed:
+        return _json({'detail': 'The chatbot is restarting, please try again shortly.'}, status=503)
+    hits = results[0]
+    return _json({
+        'answer': hits[0]['text'] if hits else "I don't understand the question.",
+        'matches': hits,
+    })
+
+
+@require_GET
+async def my_chat_rooms(request):
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    try:
+        chat_rooms, limit = inbox_page_query(inbox_queryset(user), request.GET)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    return _json(inbox_page([room async for room in chat_rooms], limit))
+
+
+@require_GET
+async def chat_room_messages(request, other_user_id, current_user_id):
+    # Open to anonymous callers like the DRF view; a matching token also marks the history read
+    user = await _authenticate(request)
+    user_ids = {other_user_id, current_user_id}
+    if await User.objects.filter(id__in=user_ids).acount() != len(user_ids):
+        return _json({'detail': 'Not found.'}, status=404)
+
+    chat_rooms = find_direct_room(current_user_id, other_user_id)
+    chat_room_data = []
+    async for chat_room in chat_rooms:
+        try:
+            messages, limit, forward = message_history_query(chat_room.id, request.GET)
+        except ValidationError as e:
+            return _json(e.detail, status=400)
+        rows = [message async for message in messages]
+        chat_room_data.append(message_history_page(chat_room.id, rows, limit, forward))
+        if user is not None and user.id == current_user_id:
+            await sync_to_async(mark_read)(chat_room.id, user.id)
+    return _json(chat_room_data)
+
+
+@require_GET
+async def wait_for_messages(request, chat_room_id):
+    """Long-poll fallback for clients without WebSockets.
+
+    Returns the room's messages after `after_id` as soon as there are any, or an
+    empty page once `timeout` seconds (default 25, at most 60) pass without one.
+    `after_id=0` waits for the first message of an empty room.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+    if not await ChatRoom.objects.filter(id=chat_room_id, users=user).aexists():
+        return _json({'detail': 'Not found.'}, status=404)
+    if not request.GET.get('after_id'):
+        return _json({'after_id': 'This parameter is required.'}, status=400)
+    try:
+        timeout = float(request.GET.get('timeout', LONG_POLL_TIMEOUT))
+    except ValueError:
+        timeout = None
+    # nan would slip past both the cap and the deadline check
+    if timeout is None or not math.isfinite(timeout) or timeout < 0:
+        return _json({'timeout': 'A valid non-negative number is required.'}, status=400)
+    timeout = min(timeout, LONG_POLL_MAX_TIMEOUT)
+
+    deadline = time.monotonic() + timeout
+    # Register before querying, so a message committed in between still wakes us
+    with RoomWaiter(chat_room_id) as waiter:
+        while True:
+            try:
+                messages, limit, forward = message_history_query(chat_room_id, request.GET)
+            except ValidationError as e:
+                return _json(e.detail, status=400)
+            rows = [message async for message in messages]
+            remaining = deadline - time.monotonic()
+            if rows or remaining <= 0:
+                break
+            await waiter.wait(min(remaining, LONG_POLL_RECHECK))
+
+    if rows:
+        await sync_to_async(mark_read)(chat_room_id, user.id)
+    return _json(message_history_page(chat_room_id, rows, limit, forward))
+
+
+@require_GET
+async def quiz_list(request):
+    """QuizListView on the event loop: the same paging, cached pages, 304s and include_status.
+
+    Open to anonymous callers; a token is only needed for include_status.
+    """
+    user = await _authenticate(request)
+    include_status = wants_status(user, request.GET)
+    # The nested provider and profile are joined up front, serialisation never touches the database
+    quizzes = Quiz.objects.select_related('provider', 'provider__profile_pic')
+    serializer_class = QuizSerializer
+    if include_status:
+        quizzes = with_user_status(quizzes, user)
+        serializer_class = QuizWithStatusSerializer
+
+    try:
+        page, limit = catalogue_page_query(quizzes, request.GET)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+
+    async def get_catalogue_page():
+        rows = [quiz async for quiz in page]
+        return catalogue_page(rows, limit, lambda rows: serializer_class(rows, many=True, context={'request': request}).data)
+
+    # Per-user pages change on every submission, so they skip the cache
+    if include_status:
+        return _json(await get_catalogue_page())
+
+    etag, last_modified, cache_key = catalogue_validators(request.build_absolute_uri(), await acatalogue_version())
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    data = await cache.aget(cache_key)
+    if data is None:
+        data = await get_catalogue_page()
+        await cache.aset(cache_key, data, CATALOGUE_PAGE_TIMEOUT)
+    response = _json(data)
+    set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,102 @@
+# Cached quiz catalogue pages, with conditional GET.
+#
+# The catalogue version is read from the database on every request: the quiz count
+# and the latest updated_at. Every process therefore agrees on it, and a page cached
+# under an older version is never served again; it simply expires.
+import hashlib
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .models import Quiz
+from .pagination import Keyset, keyset_page_query, keyset_results
+from .quiz_status import with_user_status
+from .serializers import QuizWithStatusSerializer
+
+CATALOGUE_PAGE_TIMEOUT = 600
+# Counting catches deletes, the latest updated_at catches creates and edits
+VERSION_AGGREGATES = {'count': Count('id'), 'updated_at': Max('updated_at')}
+# Pages run newest first
+CATALOGUE_KEY = Keyset(('created_at', 'id'), (datetime, int))
+
+
+def catalogue_version() -> dict:
+    return Quiz.objects.aggregate(**VERSION_AGGREGATES)
+
+async def acatalogue_version() -> dict:
+    return await Quiz.objects.aaggregate(**VERSION_AGGREGATES)
+
+def catalogue_validators(url: str, version: dict) -> tuple:
+    """(etag, last_modified, cache_key) of the catalogue page at url under version."""
+    updated_at = version['updated_at'].timestamp() if version['updated_at'] else 0
+    # The absolute URL covers the host of the profile picture links and every query parameter
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    tag = f"{version['count']}-{updated_at!r}"
+    return quote_etag(f'{tag}-{key[:16]}'), int(updated_at), f'quiz_catalogue:{tag}:{key}'
+
+def not_modified(request, etag: str, last_modified: int):
+    # A 304 (or 412) when the client's copy is current, else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+def set_validators(response, etag: str, last_modified: int) -> None:
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+
+def wants_status(user, params) -> bool:
+    return user is not None and user.is_authenticated and params.get('include_status') in ('1', 'true')
+
+def catalogue_page_query(quizzes, params):
+    """The quiz query for one catalogue page; returns (queryset, limit).
+
+    Without limit/cursor the whole list is returned as before and limit is None;
+    with them, pages newest first, keyed on (created_at, id).
+    """
+    return keyset_page_query(quizzes, params, CATALOGUE_KEY, optional=True)
+
+def catalogue_page(rows, limit, serialize):
+    return keyset_results(rows, limit, CATALOGUE_KEY, serialize)
+
+
+class QuizCatalogueMixin:
+    """list() for quiz catalogue views: cached pages and 304s while the catalogue is unchanged.
+
+    See catalogue_page_query for paging. `include_status=true` adds the signed-in
+    user's status to every quiz; those pages are per user and change on every
+    submission, so they skip the cache.
+    """
+
+    def include_status(self):
+        return wants_status(self.request.user, self.request.query_params)
+
+    def get_serializer_class(self):
+        return QuizWithStatusSerializer if self.include_status() else super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        if self.include_status():
+            return Response(self.get_catalogue_page(request.query_params))
+
+        etag, last_modified, cache_key = catalogue_validators(request.build_absolute_uri(), catalogue_version())
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        data = cache.get(cache_key)
+        if data is None:
+            data = self.get_catalogue_page(request.query_params)
+            cache.set(cache_key, data, CATALOGUE_PAGE_TIMEOUT)
+        response = Response(data)
+        set_validators(response, etag, last_modified)
+        return response
+
+    def get_catalogue_page(self, params):
+        quizzes = self.filter_queryset(self.get_queryset())
+        if self.include_status():
+            quizzes = with_user_status(quizzes, self.request.user)
+        quizzes, limit = catalogue_page_query(quizzes, params)
+        return catalogue_page(quizzes, limit, lambda rows: self.get_serializer(rows, many=True).data)
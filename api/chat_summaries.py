@@ -0,0 +1,112 @@
+# Maintenance of the denormalised last-message summary and per-user unread counts on ChatRoom.
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+
+from .models import ChatRoom, ChatRoomReadState, Message
+
+SUMMARY_FIELDS = ['last_message', 'last_message_preview', 'last_activity_at']
+
+
+def make_preview(content: str) -> str:
+    return content[:ChatRoom.PREVIEW_LENGTH]
+
+def create_read_states(chat_room, users) -> None:
+    ChatRoomReadState.objects.bulk_create(
+        [ChatRoomReadState(chat_room=chat_room, user=user) for user in users],
+        ignore_conflicts=True,
+    )
+
+# Call inside the transaction that saved the message
+def record_message(message) -> None:
+    # The guard keeps a slower concurrent send from overwriting a newer summary
+    ChatRoom.objects.filter(
+        Q(last_activity_at__isnull=True) | Q(last_activity_at__lte=message.timestamp),
+        pk=message.chat_room_id,
+    ).update(
+        last_message=message,
+        last_message_preview=make_preview(message.content),
+        last_activity_at=message.timestamp,
+    )
+    ChatRoomReadState.objects.filter(chat_room_id=message.chat_room_id).exclude(user_id=message.sender_id).update(
+        unread_count=F('unread_count') + 1,
+    )
+
+# Batched record_message for messages from one sender, each the newest of its own room, as in a bulk send
+def record_messages(messages, batch_size: int = 500) -> None:
+    rooms = [
+        ChatRoom(
+            pk=message.chat_room_id,
+            last_message_id=message.pk,
+            last_message_preview=make_preview(message.content),
+            last_activity_at=message.timestamp,
+        )
+        for message in messages
+    ]
+    ChatRoom.objects.bulk_update(rooms, SUMMARY_FIELDS, batch_size=batch_size)
+    for start in range(0, len(messages), batch_size):
+        batch = messages[start:start + batch_size]
+        ChatRoomReadState.objects.filter(
+            chat_room_id__in=[message.chat_room_id for message in batch],
+        ).exclude(user_id=batch[0].sender_id).update(unread_count=F('unread_count') + 1)
+
+def mark_read(chat_room_id, user_id) -> None:
+    ChatRoomReadState.objects.filter(chat_room_id=chat_room_id, user_id=user_id, unread_count__gt=0).update(unread_count=0)
+
+
+def summary_mismatches(rooms=None):
+    """Yield (room, expected) for every room whose stored summary differs from its messages.
+
+    expected maps each of SUMMARY_FIELDS (last_message as an id) to the value derived from Message.
+    """
+    latest = Message.objects.filter(chat_room=OuterRef('pk')).order_by('-timestamp', '-id')
+    rooms = (rooms if rooms is not None else ChatRoom.objects.all()).annotate(
+        latest_id=Subquery(latest.values('id')[:1]),
+        latest_content=Subquery(latest.values('content')[:1]),
+        latest_timestamp=Subquery(latest.values('timestamp')[:1]),
+    )
+    for room in rooms.order_by('id').iterator(chunk_size=1000):
+        expected = {
+            'last_message': room.latest_id,
+            'last_message_preview': make_preview(room.latest_content or ''),
+            'last_activity_at': room.latest_timestamp,
+        }
+        actual = {
+            'last_message': room.last_message_id,
+            'last_message_preview': room.last_message_preview,
+            'last_activity_at': room.last_activity_at,
+        }
+        if actual != expected:
+            yield room, expected
+
+def missing_read_states():
+    """(chat_room_id, user_id) pairs of room members without a read-state row."""
+    Membership = ChatRoom.users.through
+    existing = ChatRoomReadState.objects.filter(chat_room_id=OuterRef('chatroom_id'), user_id=OuterRef('user_id'))
+    return (
+        Membership.objects.filter(~Exists(existing))
+        .values_list('chatroom_id', 'user_id')
+        .order_by('chatroom_id', 'user_id')
+    )
+
+def backfill_summaries(batch_size: int = 1000) -> tuple:
+    """Rewrite every stale summary and create missing read-state rows; returns (rooms fixed, rows created)."""
+    stale = []
+    fixed = 0
+    for room, expected in summary_mismatches():
+        room.last_message_id = expected['last_message']
+        room.last_message_preview = expected['last_message_preview']
+        room.last_activity_at = expected['last_activity_at']
+        stale.append(room)
+        if len(stale) >= batch_size:
+            ChatRoom.objects.bulk_update(stale, SUMMARY_FIELDS)
+            fixed += len(stale)
+            stale = []
+    if stale:
+        ChatRoom.objects.bulk_update(stale, SUMMARY_FIELDS)
+        fixed += len(stale)
+    # Read tracking starts now, so rows created here begin with nothing unread
+    missing = [
+        ChatRoomReadState(chat_room_id=chat_room_id, user_id=user_id)
+        for chat_room_id, user_id in missing_read_states()
+    ]
+    ChatRoomReadState.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+    return fixed, len(missing)
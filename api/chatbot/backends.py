@@ -0,0 +1,124 @@
+import inspect
+import json
+import logging
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from .conf import chatbot_setting
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'torch-int8', 'onnx')
+# Bumped when the export changes, so stale exports are redone on the next load
+ONNX_EXPORT_VERSION = 2
+
+
+def load_torch(name: str):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(name, device='cpu')
+    model.eval()
+    return model
+
+def load_torch_int8(name: str):
+    # Dynamic quantisation: Linear weights stored as int8, activations quantised on the fly
+    import torch
+
+    model = load_torch(name)
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEncoder:
+    """The SentenceTransformer's transformer exported to ONNX and run with ONNX Runtime.
+
+    Mean pooling and normalisation, the remaining modules of the sentence pipeline,
+    are done in NumPy, so serving needs neither torch nor sentence_transformers.
+    """
+
+    def __init__(self, export_dir: Path, threads: int = None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(export_dir / 'encoder.json', encoding='utf-8') as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+        options = onnxruntime.SessionOptions()
+        threads = threads or chatbot_setting('CHATBOT_ONNX_THREADS')
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(export_dir / 'model.onnx'), options, providers=['CPUExecutionProvider'],
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.config['max_seq_length'], return_tensors='np',
+            )
+            feeds = {key: value.astype(np.int64) for key, value in inputs.items() if key in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def export_onnx(name: str, export_dir: Path) -> None:
+    import torch
+
+    model = load_torch(name)
+    transformer = model[0]
+    export_dir.mkdir(parents=True, exist_ok=True)
+    sample = transformer.tokenizer(['warm-up'], return_tensors='pt')
+    # Graph inputs follow forward()'s signature (input_ids, attention_mask, token_type_ids for BERT),
+    # not the tokenizer's key order, and the sample is passed by name so nothing is swapped
+    parameters = inspect.signature(transformer.auto_model.forward).parameters
+    input_names = [parameter for parameter in parameters if parameter in sample]
+    dynamic_axes = {key: {0: 'batch', 1: 'sequence'} for key in input_names}
+    dynamic_axes['token_embeddings'] = {0: 'batch', 1: 'sequence'}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer.auto_model,
+            ({key: sample[key] for key in input_names},),
+            str(export_dir / 'model.onnx'),
+            input_names=input_names,
+            output_names=['token_embeddings'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    transformer.tokenizer.save_pretrained(str(export_dir))
+    with open(export_dir / 'encoder.json', 'w', encoding='utf-8') as f:
+        json.dump({'model': name, 'max_seq_length': model.max_seq_length, 'version': ONNX_EXPORT_VERSION}, f)
+    logger.info(f"Exported {name} to ONNX in {export_dir}.")
+
+def _export_version(export_dir: Path):
+    try:
+        with open(export_dir / 'encoder.json', encoding='utf-8') as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return None
+
+def load_onnx(name: str, threads: int = None) -> OnnxEncoder:
+    # threads overrides CHATBOT_ONNX_THREADS for this session
+    export_dir = Path(chatbot_setting('CHATBOT_INDEX_DIR')) / 'onnx' / name.replace('/', '__')
+    # Exported once and reused; only the export itself needs torch
+    if _export_version(export_dir) != ONNX_EXPORT_VERSION:
+        export_onnx(name, export_dir)
+    return OnnxEncoder(export_dir, threads)
+
+
+LOADERS = {
+    'torch': load_torch,
+    'torch-int8': load_torch_int8,
+    'onnx': load_onnx,
+}
@@ -0,0 +1,110 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from .conf import chatbot_setting
+from .encoder import encode
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects texts submitted by concurrent requests and encodes them in one forward pass.
+
+    A batch is flushed when it reaches max_batch items or when window_ms has passed
+    since its first item arrived, whichever comes first.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], window_ms: float, max_batch: int):
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self) -> None:
+        # Threads do not survive fork(), so a worker forked after first use starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='chatbot-micro-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_running()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result(timeout=timeout) for future in futures])
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            pending = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            try:
+                embeddings = self.encode_fn([text for text, _ in pending])
+            except Exception as e:
+                logger.error(f"Error encoding a batch of {len(pending)} questions: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(pending, embeddings):
+                future.set_result(embedding)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+_disabled = False
+
+
+def get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    encode,
+                    window_ms=chatbot_setting('CHATBOT_BATCH_WINDOW_MS'),
+                    max_batch=chatbot_setting('CHATBOT_BATCH_MAX_SIZE'),
+                )
+    return _batcher
+
+# Used by inference pool workers, which only ever run one request at a time
+def disable_micro_batching() -> None:
+    global _disabled
+    _disabled = True
+
+# Encode questions through the shared micro-batcher, or directly when batching is switched off
+def encode_questions(questions: List[str]) -> np.ndarray:
+    if chatbot_setting('CHATBOT_MICRO_BATCHING') and not _disabled:
+        return get_batcher().encode(questions)
+    return encode(questions)
@@ -0,0 +1,156 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .conf import chatbot_setting
+
+_MISSING = object()
+
+
+def normalize_question(question: str) -> str:
+    # "What is  APR?" and "what is apr" share one entry
+    return ' '.join(re.sub(r'[?!.\s]+$', '', question.strip()).lower().split())
+
+
+def _encoder_id():
+    return chatbot_setting('CHATBOT_MODEL_NAME'), chatbot_setting('CHATBOT_ENCODER_BACKEND')
+
+
+class LocalLRUCache:
+    """In-process LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return _MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """Stores entries in a Django cache alias, shared between workers."""
+
+    def __init__(self, alias: str, ttl: float):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key: str) -> Any:
+        return self.cache.get(f'chatbot:{key}', _MISSING)
+
+    def set(self, key: str, value: Any) -> None:
+        self.cache.set(f'chatbot:{key}', value, timeout=self.ttl)
+
+    # Keys carry the index version, so stale entries simply stop being read and expire
+    def clear(self) -> None:
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class QuestionCache:
+    """Question embeddings and final answers, keyed on the normalised question text.
+
+    Answers are also keyed on the knowledge-index version, and a version change
+    drops every local entry, so no answer outlives the index it came from.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.version = None
+        self.hits = {'embedding': 0, 'answer': 0}
+        self.misses = {'embedding': 0, 'answer': 0}
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, question: str, *parts) -> str:
+        digest = hashlib.sha1(normalize_question(question).encode('utf-8')).hexdigest()
+        return ':'.join([kind, *map(str, parts), digest])
+
+    def _count(self, kind: str, hit: bool) -> None:
+        with self._lock:
+            (self.hits if hit else self.misses)[kind] += 1
+
+    def use_version(self, version: str) -> None:
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.backend.clear()
+                    self.version = version
+
+    def get_embedding(self, question: str):
+        value = self.backend.get(self._key('embedding', question, *_encoder_id()))
+        self._count('embedding', value is not _MISSING)
+        return None if value is _MISSING else value
+
+    def set_embedding(self, question: str, embedding) -> None:
+        self.backend.set(self._key('embedding', question, *_encoder_id()), embedding)
+
+    # Returns (found, answer); a cached answer can legitimately be None
+    def get_answer(self, question: str, *params):
+        value = self.backend.get(self._key('answer', question, self.version, *params))
+        self._count('answer', value is not _MISSING)
+        return (False, None) if value is _MISSING else (True, value)
+
+    def set_answer(self, question: str, answer, *params) -> None:
+        self.backend.set(self._key('answer', question, self.version, *params), answer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'version': self.version,
+                'size': len(self.backend),
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_question_cache() -> Optional[QuestionCache]:
+    global _cache
+    backend_name = chatbot_setting('CHATBOT_CACHE_BACKEND')
+    if not backend_name:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = chatbot_setting('CHATBOT_CACHE_TTL')
+                if backend_name == 'django':
+                    backend = DjangoCacheBackend(chatbot_setting('CHATBOT_CACHE_ALIAS'), ttl)
+                else:
+                    backend = LocalLRUCache(chatbot_setting('CHATBOT_CACHE_SIZE'), ttl)
+                _cache = QuestionCache(backend)
+    return _cache
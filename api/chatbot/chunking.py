@@ -0,0 +1,89 @@
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from .documents import Paragraph
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+class _Unit(NamedTuple):
+    paragraph: int
+    page: Optional[int]
+    text: str
+    tokens: int
+    # Sentences of one long paragraph are joined with spaces, separate paragraphs with newlines
+    continues_paragraph: bool
+
+
+def count_tokens(text: str) -> int:
+    # Whitespace words; close enough to the encoder's word pieces for budgeting
+    return len(text.split())
+
+def _units(paragraph: Paragraph, max_tokens: int) -> Iterator[_Unit]:
+    tokens = count_tokens(paragraph.text)
+    if tokens <= max_tokens:
+        yield _Unit(paragraph.index, paragraph.page, paragraph.text, tokens, False)
+        return
+    # Paragraphs over budget are split on sentence boundaries, then on words if still too long
+    first = True
+    for sentence in _SENTENCE_END.split(paragraph.text):
+        words = sentence.split()
+        for start in range(0, len(words), max_tokens):
+            piece = words[start:start + max_tokens]
+            yield _Unit(paragraph.index, paragraph.page, ' '.join(piece), len(piece), not first)
+            first = False
+
+def _make_chunk(heading: dict, units: List[_Unit]) -> dict:
+    text = ''
+    for unit in units:
+        if text:
+            text += ' ' if unit.continues_paragraph else '\n'
+        text += unit.text
+    if heading is not None:
+        text = f"{heading['text']}\n{text}"
+    return {
+        'text': text,
+        'heading': heading['text'] if heading is not None else None,
+        # Paragraph offsets in the source document, end exclusive
+        'start': units[0].paragraph,
+        'end': units[-1].paragraph + 1,
+        'page': units[0].page,
+    }
+
+
+def chunk_paragraphs(paragraphs: Iterable[Paragraph], max_tokens: int = 180, overlap: int = 30) -> Iterator[dict]:
+    """Pack paragraphs into chunks of at most max_tokens words.
+
+    A heading always starts a new chunk and is prefixed to every chunk of its
+    section. Consecutive chunks of a section share up to `overlap` words of
+    trailing paragraphs or sentences.
+    """
+    heading = None
+    units: List[_Unit] = []
+    tokens = 0
+    fresh = 0  # units added since the last emitted chunk
+
+    for paragraph in paragraphs:
+        if paragraph.is_heading:
+            if fresh:
+                yield _make_chunk(heading, units)
+            heading = {'text': paragraph.text}
+            units, tokens, fresh = [], 0, 0
+            continue
+        for unit in _units(paragraph, max_tokens):
+            if units and tokens + unit.tokens > max_tokens:
+                yield _make_chunk(heading, units)
+                # Carry the tail of the previous chunk over as context for the next one
+                carried, carried_tokens = [], 0
+                for previous in reversed(units):
+                    if carried_tokens + previous.tokens > overlap or carried_tokens + previous.tokens + unit.tokens > max_tokens:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += previous.tokens
+                units, tokens, fresh = carried, carried_tokens, 0
+            units.append(unit)
+            tokens += unit.tokens
+            fresh += 1
+
+    if fresh:
+        yield _make_chunk(heading, units)
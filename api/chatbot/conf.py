@@ -0,0 +1,65 @@
+from django.conf import settings
+
+# Defaults for the chatbot settings; any of them can be overridden in backend/settings.py
+DEFAULTS = {
+    'CHATBOT_MODEL_NAME': 'all-MiniLM-L6-v2',
+    # Inference backend: 'torch' (fp32), 'torch-int8' (dynamic quantisation) or 'onnx' (ONNX Runtime)
+    'CHATBOT_ENCODER_BACKEND': 'torch',
+    'CHATBOT_INDEX_DIR': settings.BASE_DIR / 'chatbot_index',
+    # Knowledge base: individual DOCX/PDF files plus every DOCX/PDF file in the listed directories.
+    # api/knowledge.pdf is the same article as knowledge.docx, so only one of them is indexed
+    'CHATBOT_KNOWLEDGE_FILES': [
+        settings.BASE_DIR / 'api' / 'knowledge.docx',
+    ],
+    'CHATBOT_KNOWLEDGE_DIRS': [],
+    # Chunks encoded per forward pass during ingestion; bounds memory whatever the document size
+    'CHATBOT_INGEST_BATCH_SIZE': 64,
+    # Chunk budget and overlap between consecutive chunks of a section, in words
+    'CHATBOT_CHUNK_TOKENS': 180,
+    'CHATBOT_CHUNK_OVERLAP': 30,
+    # Seconds between knowledge file checks; each check is a stat() unless the file changed
+    'CHATBOT_WATCH_INTERVAL': 2.0,
+    # Load the encoder when the WSGI/ASGI app is created instead of on the first chatbot request
+    'CHATBOT_PRELOAD_ENCODER': False,
+    # With a pre-forking server (gunicorn --preload), keep the preloaded weights shared copy-on-write
+    'CHATBOT_FORK_FRIENDLY': False,
+    # torch threads per forked worker
+    'CHATBOT_WORKER_THREADS': 1,
+    # ONNX Runtime intra-op threads per session; None uses one per core, like torch does by default
+    'CHATBOT_ONNX_THREADS': None,
+    # Questions arriving within the window are encoded together, up to the max batch size
+    'CHATBOT_MICRO_BATCHING': True,
+    'CHATBOT_BATCH_WINDOW_MS': 10,
+    'CHATBOT_BATCH_MAX_SIZE': 32,
+    # Largest list accepted by POST /api/chatbot/batch/
+    'CHATBOT_BATCH_MAX_QUESTIONS': 64,
+    # Retrieval: exact NumPy search below CHATBOT_ANN_MIN_CHUNKS chunks, an ANN index ('ivf' or 'hnsw') above
+    'CHATBOT_ANN_BACKEND': 'ivf',
+    'CHATBOT_ANN_MIN_CHUNKS': 20000,
+    'CHATBOT_ANN_NPROBE': 8,
+    'CHATBOT_ANN_EF': 64,
+    'CHATBOT_MAX_K': 10,
+    # 'dense', 'lexical' (BM25 only, skips the encoder) or 'hybrid' (BM25 and dense rankings fused)
+    'CHATBOT_RETRIEVAL_MODE': 'dense',
+    # Hybrid mode: BM25 candidates per question, and whether dense scoring is limited to them
+    'CHATBOT_LEXICAL_CANDIDATES': 100,
+    'CHATBOT_LEXICAL_PREFILTER': True,
+    # Where chatbot inference runs: 'inline' (the request thread) or 'process' (a pool of model-holding workers)
+    'CHATBOT_EXECUTOR': 'inline',
+    'CHATBOT_EXECUTOR_WORKERS': 2,
+    # Requests queued or running in the pool before new ones get 429 with Retry-After
+    'CHATBOT_EXECUTOR_MAX_PENDING': 32,
+    'CHATBOT_EXECUTOR_TIMEOUT': 10.0,
+    'CHATBOT_EXECUTOR_RETRY_AFTER': 1,
+    'CHATBOT_EXECUTOR_START_METHOD': 'spawn',
+    # 'local' (per-process LRU), 'django' (the CHATBOT_CACHE_ALIAS cache) or None to disable.
+    # With the 'process' executor the cache lives in the workers, and the cache-stats endpoint is off
+    'CHATBOT_CACHE_BACKEND': 'local',
+    'CHATBOT_CACHE_ALIAS': 'default',
+    'CHATBOT_CACHE_SIZE': 1024,
+    'CHATBOT_CACHE_TTL': 3600,
+}
+
+
+def chatbot_setting(name: str):
+    return getattr(settings, name, DEFAULTS[name])
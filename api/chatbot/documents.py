@@ -0,0 +1,79 @@
+import logging
+import os
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
+
+from docx import Document
+
+from .conf import chatbot_setting
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.docx', '.pdf')
+
+
+class Paragraph(NamedTuple):
+    index: int
+    text: str
+    is_heading: bool
+    page: Optional[int] = None
+
+
+# Every knowledge file: the configured files plus the DOCX/PDF files of the configured directories
+def list_knowledge_files() -> List[str]:
+    files = [str(path) for path in chatbot_setting('CHATBOT_KNOWLEDGE_FILES') if os.path.exists(path)]
+    for directory in chatbot_setting('CHATBOT_KNOWLEDGE_DIRS'):
+        if os.path.isdir(directory):
+            files.extend(
+                str(path) for path in sorted(Path(directory).iterdir())
+                if path.suffix.lower() in SUPPORTED_EXTENSIONS and path.is_file()
+            )
+    # The same file listed twice would be indexed twice
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+# Paths to watch for changes; directories are included so added or removed files are noticed
+def list_watched_paths() -> List[str]:
+    return list_knowledge_files() + [str(directory) for directory in chatbot_setting('CHATBOT_KNOWLEDGE_DIRS')]
+
+# Yield the non-empty paragraphs of a DOCX file, keeping their position in the document
+def iter_docx_paragraphs(file_path: str) -> Iterator[Paragraph]:
+    if not os.path.exists(file_path):
+        logger.error(f"DOCX file does not exist at: {file_path}")
+        return
+    try:
+        doc = Document(file_path)
+    except Exception as e:
+        logger.error(f"Error loading DOCX: {e}")
+        return
+    for index, paragraph in enumerate(doc.paragraphs):
+        text = paragraph.text.strip()
+        if not text:
+            continue
+        style_name = paragraph.style.name if paragraph.style is not None else ''
+        yield Paragraph(index, text, style_name.startswith(('Heading', 'Title')))
+
+# Yield the text blocks of a PDF one page at a time; only the current page is held in memory
+def iter_pdf_paragraphs(file_path: str) -> Iterator[Paragraph]:
+    import fitz  # PyMuPDF
+
+    try:
+        doc = fitz.open(file_path)
+    except Exception as e:
+        logger.error(f"Error loading PDF: {e}")
+        return
+    index = 0
+    with doc:
+        for page_number, page in enumerate(doc):
+            for block in page.get_text('blocks'):
+                # (x0, y0, x1, y1, text, block_no, block_type); type 1 is an image
+                if block[6] != 0:
+                    continue
+                text = ' '.join(block[4].split())
+                if text:
+                    yield Paragraph(index, text, False, page_number + 1)
+                    index += 1
+
+def iter_paragraphs(file_path: str) -> Iterator[Paragraph]:
+    if file_path.lower().endswith('.pdf'):
+        return iter_pdf_paragraphs(file_path)
+    return iter_docx_paragraphs(file_path)
@@ -0,0 +1,66 @@
+import gc
+import logging
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from .conf import chatbot_setting
+
+logger = logging.getLogger(__name__)
+
+# Loaded encoders keyed by (model name, backend); nothing is loaded until the chatbot is first used
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(name: Optional[str] = None, backend: Optional[str] = None):
+    key = (name or chatbot_setting('CHATBOT_MODEL_NAME'), backend or chatbot_setting('CHATBOT_ENCODER_BACKEND'))
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                # Loaders import torch/onnxruntime themselves, so manage.py commands and migrations never pay for them
+                from .backends import LOADERS
+
+                if key[1] not in LOADERS:
+                    raise ValueError(f"Unknown CHATBOT_ENCODER_BACKEND {key[1]!r}, expected one of {sorted(LOADERS)}.")
+                logger.info(f"Loading sentence encoder {key[0]} ({key[1]}).")
+                model = LOADERS[key[1]](key[0])
+                _models[key] = model
+    return model
+
+
+# Encode texts into L2-normalised float32 rows, so a dot product is the cosine similarity
+def encode(texts: List[str], batch_size: int = 32, backend: Optional[str] = None) -> np.ndarray:
+    embeddings = get_model(backend=backend).encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _after_fork_in_child() -> None:
+    # The parent's intra-op thread pool does not survive fork(); size a fresh one per worker
+    if chatbot_setting('CHATBOT_ENCODER_BACKEND') != 'onnx':
+        import torch
+
+        torch.set_num_threads(chatbot_setting('CHATBOT_WORKER_THREADS'))
+
+# Opt-in warm-up, called from the WSGI/ASGI module so a pre-forking server loads once in the master
+def preload() -> None:
+    from .index import get_index
+
+    encode(['warm-up'])
+    get_index()
+    if chatbot_setting('CHATBOT_FORK_FRIENDLY'):
+        # Move everything allocated so far out of the collector's reach: a GC pass in a
+        # forked worker would otherwise write to every object header and un-share the weights
+        gc.collect()
+        gc.freeze()
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+    logger.info("Chatbot encoder and knowledge index preloaded.")
@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from .conf import chatbot_setting
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusy(Exception):
+    """Every slot of the bounded queue is taken; the caller should retry later."""
+
+
+class ExecutorTimeout(Exception):
+    """The work did not finish within the per-request timeout."""
+
+
+class ExecutorFailed(Exception):
+    """A worker process died while running the work; the pool has been replaced."""
+
+
+def _init_worker() -> None:
+    import django
+
+    django.setup()
+    from .batching import disable_micro_batching
+    from .encoder import get_model
+    from .index import get_index
+
+    # A worker runs one task at a time, so there is nothing to batch with
+    disable_micro_batching()
+    # Load the model and index now rather than in the first request that reaches this worker
+    get_model()
+    get_index()
+
+
+class InlineExecutor:
+    """Runs the work on the calling thread, as before the pool existed."""
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        return fn(*args)
+
+    async def arun(self, fn: Callable, *args, timeout: Optional[float] = None):
+        from asgiref.sync import sync_to_async
+
+        # Off the event loop, and off the single thread shared by thread-sensitive sync code
+        return await sync_to_async(fn, thread_sensitive=False)(*args)
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+
+class ProcessExecutor:
+    """A pool of worker processes, each holding its own encoder and index.
+
+    At most max_pending tasks may be queued or running; past that, run() raises
+    ExecutorBusy instead of queueing, and a task that takes longer than the
+    timeout raises ExecutorTimeout. A worker dying mid-task raises ExecutorFailed
+    and replaces the pool, so the next request gets fresh workers.
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float, start_method: str = 'spawn'):
+        self.workers = workers
+        self.timeout = timeout
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = self._create_pool()
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+        )
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        # A worker died (e.g. killed for memory); only the first caller to notice replaces the pool
+        with self._lock:
+            if self._pool is broken:
+                logger.error("Inference pool is broken, starting a new one.")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._create_pool()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusy()
+        try:
+            pool = self._pool
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                self._replace_pool(pool)
+                pool = self._pool
+                future = pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        future.pool = pool
+        return future
+
+    def _failed(self, future: Future) -> ExecutorFailed:
+        self._replace_pool(future.pool)
+        return ExecutorFailed()
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise ExecutorTimeout()
+        except BrokenProcessPool:
+            raise self._failed(future)
+
+    async def arun(self, fn: Callable, *args, timeout: Optional[float] = None):
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise ExecutorTimeout()
+        except BrokenProcessPool:
+            raise self._failed(future)
+
+    def shutdown(self, wait: bool = True) -> None:
+        # Queued work is dropped, work already running is allowed to finish
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if chatbot_setting('CHATBOT_EXECUTOR') == 'process':
+                    _executor = ProcessExecutor(
+                        workers=chatbot_setting('CHATBOT_EXECUTOR_WORKERS'),
+                        max_pending=chatbot_setting('CHATBOT_EXECUTOR_MAX_PENDING'),
+                        timeout=chatbot_setting('CHATBOT_EXECUTOR_TIMEOUT'),
+                        start_method=chatbot_setting('CHATBOT_EXECUTOR_START_METHOD'),
+                    )
+                    atexit.register(shutdown_executor)
+                else:
+                    _executor = InlineExecutor()
+    return _executor
+
+def shutdown_executor(wait: bool = True) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .conf import chatbot_setting
+from .documents import list_knowledge_files, list_watched_paths
+from .ingest import (
+    COPY_BLOCK_ROWS, hash_file, index_settings, ingest_document, iter_segment_chunks,
+    load_segment_embeddings, prune_segments, raw_to_npy, segment_is_current, write_atomic,
+)
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .retrieval import build_searcher
+from .watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_lock = threading.Lock()
+_watcher = None
+_rebuild_lock = threading.Lock()
+_rebuild_thread = None
+_rebuild_pending = False
+
+
+class KnowledgeIndex:
+    """Chunks (text, source, heading and paragraph offsets) plus their normalised embeddings, one row per chunk.
+
+    The key is derived from the content hash of every knowledge document and the index settings.
+    """
+
+    def __init__(self, key: str, chunks: List[dict], embeddings: np.ndarray):
+        self.key = key
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self._searcher = None
+        self._lexical = None
+        self._searcher_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def version(self) -> str:
+        # Changes with any document and with anything that changes how they are chunked or encoded
+        return self.key[:24]
+
+    # Exact search for small corpora, an ANN index once it grows; built on first use
+    @property
+    def searcher(self):
+        if self._searcher is None:
+            with self._searcher_lock:
+                if self._searcher is None:
+                    self._searcher = build_searcher(self.embeddings)
+        return self._searcher
+
+    @property
+    def lexical(self) -> BM25Index:
+        if self._lexical is None:
+            with self._searcher_lock:
+                if self._lexical is None:
+                    self._lexical = BM25Index([chunk['text'] for chunk in self.chunks])
+        return self._lexical
+
+    def _hits(self, scores, ids, min_score: float) -> List[dict]:
+        return [
+            dict(self.chunks[idx], score=float(score))
+            for score, idx in zip(scores, ids)
+            if idx >= 0 and score >= min_score
+        ]
+
+    # Top-k chunks for each normalised question embedding, best first, dropping scores below min_score
+    def search(self, question_embeddings: np.ndarray, k: int = 1, min_score: float = 0.1) -> List[List[dict]]:
+        if not len(self):
+            return [[] for _ in range(len(question_embeddings))]
+        scores, ids = self.searcher.search(question_embeddings, k)
+        return [self._hits(row_scores, row_ids, min_score) for row_scores, row_ids in zip(scores, ids)]
+
+    # BM25 only: no encoder pass at all. Scores are raw BM25 values, min_score applies to them
+    def search_lexical(self, questions: List[str], k: int = 1, min_score: float = 0.1) -> List[List[dict]]:
+        if not len(self):
+            return [[] for _ in questions]
+        return [self._hits(*self.lexical.search(question, k), min_score) for question in questions]
+
+    def search_hybrid(self, questions: List[str], question_embeddings: np.ndarray, k: int = 1,
+                      min_score: float = 0.1, candidates: int = 100, prefilter: bool = True) -> List[List[dict]]:
+        """Fuse BM25 and cosine rankings with reciprocal rank fusion.
+
+        With prefilter, only the BM25 candidates are scored densely; questions sharing
+        no term with the corpus fall back to a plain dense search. `score` stays the
+        cosine similarity, so min_score means the same as in dense mode.
+        """
+        if not len(self):
+            return [[] for _ in questions]
+        results = []
+        for question, embedding in zip(questions, question_embeddings):
+            lexical_scores, lexical_ids = self.lexical.search(question, candidates)
+            if prefilter:
+                if not len(lexical_ids):
+                    results.append(self.search(embedding[None, :], k, min_score)[0])
+                    continue
+                # Sorted row ids keep reads from the memory-mapped matrix sequential
+                candidate_ids = np.sort(lexical_ids)
+                candidate_scores = np.asarray(self.embeddings[candidate_ids] @ embedding)
+                order = np.argsort(-candidate_scores)
+                dense_ids, dense_scores = candidate_ids[order], candidate_scores[order]
+            else:
+                scores, ids = self.searcher.search(embedding[None, :], candidates)
+                keep = ids[0] >= 0
+                dense_ids, dense_scores = ids[0][keep], scores[0][keep]
+            cosine = dict(zip(dense_ids.tolist(), dense_scores.tolist()))
+            fused = reciprocal_rank_fusion([dense_ids, lexical_ids])
+            lexical = dict(zip(lexical_ids.tolist(), lexical_scores.tolist()))
+            hits = []
+            for idx in sorted(fused, key=fused.get, reverse=True):
+                score = cosine.get(idx)
+                if score is None:
+                    score = float(self.embeddings[idx] @ embedding)
+                if score < min_score:
+                    continue
+                hits.append(dict(
+                    self.chunks[idx], score=float(score),
+                    lexical_score=float(lexical.get(idx, 0.0)), fused_score=fused[idx],
+                ))
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results
+
+
+def get_index_dir() -> Path:
+    return Path(chatbot_setting('CHATBOT_INDEX_DIR'))
+
+def hash_documents(files: List[str]) -> List[Tuple[str, str]]:
+    return [(file_path, hash_file(file_path)) for file_path in files]
+
+def corpus_key(documents: List[Tuple[str, str]]) -> str:
+    payload = {
+        'documents': [[os.path.basename(file_path), doc_hash] for file_path, doc_hash in documents],
+        'settings': index_settings(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _index_paths(key: str, index_dir: Path):
+    return index_dir / f'{key}.npy', index_dir / f'{key}.json'
+
+
+# Concatenate the document segments into one memory-mappable matrix, streaming block by block
+def _combine_segments(key: str, documents: List[Tuple[str, str]], index_dir: Path) -> None:
+    npy_path, meta_path = _index_paths(key, index_dir)
+    chunks = []
+    segments = []
+    for file_path, doc_hash in documents:
+        embeddings = load_segment_embeddings(doc_hash, index_dir)
+        if embeddings.shape[0]:
+            segments.append(embeddings)
+        for chunk in iter_segment_chunks(doc_hash, index_dir):
+            chunk['source'] = os.path.basename(file_path)
+            chunks.append(chunk)
+    dim = segments[0].shape[1] if segments else 0
+    raw_fd, raw_path = tempfile.mkstemp(dir=index_dir, suffix='.f32')
+    try:
+        with os.fdopen(raw_fd, 'wb') as raw:
+            for embeddings in segments:
+                for start in range(0, embeddings.shape[0], COPY_BLOCK_ROWS):
+                    raw.write(np.ascontiguousarray(embeddings[start:start + COPY_BLOCK_ROWS]).tobytes())
+        raw_to_npy(raw_path, len(chunks), dim, npy_path)
+    finally:
+        os.unlink(raw_path)
+    metadata = {'key': key, 'settings': index_settings(), 'chunks': chunks}
+    write_atomic(meta_path, lambda f: f.write(json.dumps(metadata).encode('utf-8')))
+
+def _prune_indexes(index_dir: Path, keep: str) -> None:
+    for path in index_dir.glob('*.npy'):
+        if path.stem != keep and len(path.stem) == 64:
+            for stale in (path, path.with_suffix('.json')):
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+def build_index(files: Optional[List[str]] = None, force: bool = False) -> KnowledgeIndex:
+    """Ingest new or changed documents and assemble the corpus index.
+
+    Documents whose content hash already has a current segment are not re-embedded
+    unless force is set.
+    """
+    index_dir = get_index_dir()
+    index_dir.mkdir(parents=True, exist_ok=True)
+    documents = hash_documents(files if files is not None else list_knowledge_files())
+    for file_path, doc_hash in documents:
+        if force or not segment_is_current(doc_hash, index_dir):
+            ingest_document(file_path, doc_hash, index_dir)
+    key = corpus_key(documents)
+    _combine_segments(key, documents, index_dir)
+    index = load_index(key, index_dir)
+    logger.info(f"Built knowledge index {key[:12]} with {len(index)} chunks from {len(documents)} documents.")
+    prune_segments(index_dir, [doc_hash for _, doc_hash in documents])
+    _prune_indexes(index_dir, key)
+    return index
+
+def load_index(key: str, index_dir: Optional[Path] = None) -> Optional[KnowledgeIndex]:
+    npy_path, meta_path = _index_paths(key, index_dir or get_index_dir())
+    if not (npy_path.exists() and meta_path.exists()):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            metadata = json.load(f)
+        embeddings = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        logger.error(f"Error loading knowledge index {key[:12]}: {e}")
+        return None
+    if metadata.get('settings') != index_settings() or len(metadata['chunks']) != embeddings.shape[0]:
+        logger.info(f"Knowledge index {key[:12]} is stale, ignoring it.")
+        return None
+    return KnowledgeIndex(key, metadata['chunks'], embeddings)
+
+def load_or_build_index(force: bool = False) -> Optional[KnowledgeIndex]:
+    files = list_knowledge_files()
+    if not files:
+        logger.error("No knowledge documents found.")
+        return None
+    if not force:
+        index = load_index(corpus_key(hash_documents(files)))
+        if index is not None:
+            return index
+    return build_index(files, force=force)
+
+
+def get_watcher() -> FileWatcher:
+    global _watcher
+    if _watcher is None:
+        with _index_lock:
+            if _watcher is None:
+                watcher = FileWatcher(
+                    list_watched_paths,
+                    on_change=rebuild_index_async,
+                    interval=chatbot_setting('CHATBOT_WATCH_INTERVAL'),
+                )
+                watcher.prime()
+                _watcher = watcher
+    return _watcher
+
+
+# Load the persisted index for the current documents, if one exists, without touching the encoder
+def preload_index() -> None:
+    global _index
+    files = list_knowledge_files()
+    if not files:
+        return
+    get_watcher()
+    index = load_index(corpus_key(hash_documents(files)))
+    if index is not None:
+        with _index_lock:
+            _index = index
+        logger.info(f"Loaded knowledge index {index.key[:12]} with {len(index)} chunks.")
+
+def get_index() -> Optional[KnowledgeIndex]:
+    global _index
+    # Prime the watcher before the first build so an edit made during it is not missed
+    get_watcher().check()
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_or_build_index()
+    return _index
+
+def set_index(index: Optional[KnowledgeIndex]) -> None:
+    global _index
+    with _index_lock:
+        _index = index
+
+
+def _rebuild_worker() -> None:
+    global _rebuild_thread, _rebuild_pending
+    while True:
+        try:
+            index = load_or_build_index()
+            # Swap the reference in one step; requests keep the index they already hold
+            if index is not None:
+                set_index(index)
+        except Exception as e:
+            logger.error(f"Error rebuilding knowledge index: {e}")
+        with _rebuild_lock:
+            if not _rebuild_pending:
+                _rebuild_thread = None
+                return
+            _rebuild_pending = False
+
+# Rebuild in a background thread; changes arriving mid-build queue exactly one more build
+def rebuild_index_async() -> None:
+    global _rebuild_thread, _rebuild_pending
+    with _rebuild_lock:
+        if _rebuild_thread is not None:
+            _rebuild_pending = True
+            return
+        _rebuild_thread = threading.Thread(target=_rebuild_worker, name='knowledge-index-rebuild', daemon=True)
+        _rebuild_thread.start()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+from .chunking import chunk_paragraphs
+from .conf import chatbot_setting
+from .documents import iter_paragraphs
+
+logger = logging.getLogger(__name__)
+
+# Rows copied per step when assembling .npy files from raw embedding data
+COPY_BLOCK_ROWS = 4096
+
+
+def index_settings() -> dict:
+    return {
+        'model': chatbot_setting('CHATBOT_MODEL_NAME'),
+        # Quantised and ONNX embeddings differ slightly from fp32 ones, so they never share an index
+        'backend': chatbot_setting('CHATBOT_ENCODER_BACKEND'),
+        'chunk_tokens': chatbot_setting('CHATBOT_CHUNK_TOKENS'),
+        'chunk_overlap': chatbot_setting('CHATBOT_CHUNK_OVERLAP'),
+    }
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_atomic(target: Path, write):
+    # Write next to the target and rename, so readers never see a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix=target.suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+def raw_to_npy(raw_path: str, rows: int, dim: int, target: Path) -> None:
+    # Copy block by block so neither file is ever fully loaded into memory
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix='.npy')
+    os.close(fd)
+    try:
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(rows, dim))
+        if rows:
+            source = np.memmap(raw_path, dtype=np.float32, mode='r', shape=(rows, dim))
+            for start in range(0, rows, COPY_BLOCK_ROWS):
+                out[start:start + COPY_BLOCK_ROWS] = source[start:start + COPY_BLOCK_ROWS]
+            del source
+        out.flush()
+        del out
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# Per-document segments live under documents/, keyed by the document's content hash
+def segment_paths(doc_hash: str, index_dir: Path):
+    base = index_dir / 'documents' / doc_hash
+    return base.with_suffix('.npy'), base.with_suffix('.jsonl'), base.with_suffix('.json')
+
+def segment_is_current(doc_hash: str, index_dir: Path) -> bool:
+    npy_path, chunks_path, manifest_path = segment_paths(doc_hash, index_dir)
+    if not (npy_path.exists() and chunks_path.exists() and manifest_path.exists()):
+        return False
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f).get('settings') == index_settings()
+    except (OSError, ValueError):
+        return False
+
+def ingest_document(file_path: str, doc_hash: str, index_dir: Path) -> int:
+    """Stream one document through chunking and encoding into its on-disk segment.
+
+    Chunks are encoded CHATBOT_INGEST_BATCH_SIZE at a time and appended to the
+    segment as they are produced, so memory stays bounded by one batch.
+    """
+    from .encoder import encode
+
+    npy_path, chunks_path, manifest_path = segment_paths(doc_hash, index_dir)
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+    chunks = chunk_paragraphs(
+        iter_paragraphs(file_path),
+        max_tokens=chatbot_setting('CHATBOT_CHUNK_TOKENS'),
+        overlap=chatbot_setting('CHATBOT_CHUNK_OVERLAP'),
+    )
+    rows, dim = 0, 0
+    raw_fd, raw_path = tempfile.mkstemp(dir=npy_path.parent, suffix='.f32')
+    try:
+        with os.fdopen(raw_fd, 'wb') as raw:
+            def write_chunks(f):
+                nonlocal rows, dim
+                for batch in _batched(chunks, chatbot_setting('CHATBOT_INGEST_BATCH_SIZE')):
+                    embeddings = encode([chunk['text'] for chunk in batch])
+                    raw.write(embeddings.tobytes())
+                    for chunk in batch:
+                        f.write((json.dumps(chunk) + '\n').encode('utf-8'))
+                    rows += len(batch)
+                    dim = embeddings.shape[1]
+            write_atomic(chunks_path, write_chunks)
+        raw_to_npy(raw_path, rows, dim, npy_path)
+    finally:
+        os.unlink(raw_path)
+    # The manifest goes last: a segment only counts once its data files are complete
+    manifest = {'doc_hash': doc_hash, 'settings': index_settings(), 'rows': rows, 'dim': dim}
+    write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+    logger.info(f"Ingested {os.path.basename(file_path)} ({doc_hash[:12]}): {rows} chunks.")
+    return rows
+
+def iter_segment_chunks(doc_hash: str, index_dir: Path) -> Iterator[dict]:
+    _, chunks_path, _ = segment_paths(doc_hash, index_dir)
+    with open(chunks_path, encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+def load_segment_embeddings(doc_hash: str, index_dir: Path) -> np.ndarray:
+    npy_path, _, _ = segment_paths(doc_hash, index_dir)
+    return np.load(npy_path, mmap_mode='r')
+
+def prune_segments(index_dir: Path, keep: List[str]) -> None:
+    keep = set(keep)
+    segment_dir = index_dir / 'documents'
+    if not segment_dir.is_dir():
+        return
+    for path in segment_dir.iterdir():
+        doc_hash = path.name.split('.')[0]
+        # Leave temporary files of a concurrent ingestion alone
+        if len(doc_hash) == 64 and doc_hash not in keep:
+            try:
+                path.unlink()
+            except OSError:
+                # Still memory-mapped by a worker on platforms that forbid unlinking it
+                pass
@@ -0,0 +1,81 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import List, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i if in into is it its me my of on or our
+should so than that the their them then there these this to was we what when where which who why
+will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of chunk texts.
+
+    Postings are stored per term as parallel arrays of chunk ids and term
+    frequencies, so scoring a query only touches chunks that contain its terms.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        doc_lengths = np.zeros(self.size, dtype=np.float32)
+        postings = defaultdict(lambda: ([], []))
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                ids, tfs = postings[term]
+                ids.append(doc_id)
+                tfs.append(tf)
+        average_length = float(doc_lengths.mean()) if self.size else 0.0
+        # Length normalisation depends only on the chunk, so it is folded in once here
+        self.length_norm = k1 * (1 - b + b * doc_lengths / max(average_length, 1e-9))
+        self.postings = {
+            term: (np.asarray(ids, dtype=np.intp), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+        self.idf = {
+            term: math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in self.postings.items()
+        }
+
+    # Score every chunk sharing a term with the query; returns (chunk ids, scores), unsorted
+    def score(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            scores[ids] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.length_norm[ids])
+        ids = np.flatnonzero(scores)
+        return ids, scores[ids]
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        ids, scores = self.score(query)
+        k = min(k, len(ids))
+        if k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.intp)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], ids[top]
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int = 60) -> dict:
+    # Rank-based, so cosine similarities and BM25 scores need no common scale
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[int(doc_id)] += 1.0 / (k + rank + 1)
+    return fused
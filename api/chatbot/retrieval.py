@@ -0,0 +1,104 @@
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .conf import chatbot_setting
+
+logger = logging.getLogger(__name__)
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Row-wise top-k of a (queries, candidates) score matrix, best first
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.float32), empty.astype(np.intp)
+    ids = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, ids, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class ExactSearch:
+    """Brute-force inner product over every row; exact, and fastest for small corpora."""
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return _top_k_rows(queries @ self.embeddings.T, k)
+
+
+class IVFSearch:
+    """Inverted-file index: rows are bucketed by their nearest k-means centroid and a
+    query only scores the rows of its `nprobe` closest buckets."""
+
+    def __init__(self, embeddings: np.ndarray, nlist: Optional[int] = None, nprobe: int = 8,
+                 iterations: int = 10, seed: int = 0):
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        nlist = min(nlist or int(np.sqrt(len(embeddings))), len(embeddings))
+        self.centroids = self._train(np.asarray(embeddings, dtype=np.float32), nlist, iterations, seed)
+        assignments = np.argmax(np.asarray(embeddings) @ self.centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        self.list_ids = np.split(order, np.searchsorted(assignments[order], np.arange(1, nlist)))
+
+    @staticmethod
+    def _train(data: np.ndarray, nlist: int, iterations: int, seed: int) -> np.ndarray:
+        # Spherical k-means: the rows are normalised, so centroids are compared by inner product
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assignments == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        return centroids
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        _, probes = _top_k_rows(queries @ self.centroids.T, self.nprobe)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.intp)
+        for row, query in enumerate(queries):
+            candidates = np.concatenate([self.list_ids[c] for c in probes[row]])
+            if not len(candidates):
+                continue
+            scores, ids = _top_k_rows((self.embeddings[candidates] @ query)[None, :], k)
+            all_scores[row, :ids.shape[1]] = scores[0]
+            all_ids[row, :ids.shape[1]] = candidates[ids[0]]
+        return all_scores, all_ids
+
+
+class HNSWSearch:
+    """Graph index from the optional hnswlib package."""
+
+    def __init__(self, embeddings: np.ndarray, ef: int = 64, m: int = 16):
+        import hnswlib
+
+        self.index = hnswlib.Index(space='ip', dim=embeddings.shape[1])
+        self.index.init_index(max_elements=len(embeddings), ef_construction=max(ef, 100), M=m)
+        self.index.add_items(np.asarray(embeddings, dtype=np.float32), np.arange(len(embeddings)))
+        self.index.set_ef(ef)
+        self.size = len(embeddings)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.size)
+        ids, distances = self.index.knn_query(queries, k=k)
+        # hnswlib's 'ip' space reports 1 - inner product
+        return (1.0 - distances).astype(np.float32), ids.astype(np.intp)
+
+
+def build_searcher(embeddings: np.ndarray):
+    backend = chatbot_setting('CHATBOT_ANN_BACKEND')
+    if not backend or len(embeddings) < chatbot_setting('CHATBOT_ANN_MIN_CHUNKS'):
+        return ExactSearch(embeddings)
+    if backend == 'hnsw':
+        try:
+            return HNSWSearch(embeddings, ef=chatbot_setting('CHATBOT_ANN_EF'))
+        except ImportError:
+            logger.warning("hnswlib is not installed, falling back to the IVF index.")
+    logger.info(f"Building IVF index over {len(embeddings)} chunks.")
+    return IVFSearch(embeddings, nprobe=chatbot_setting('CHATBOT_ANN_NPROBE'))
@@ -0,0 +1,70 @@
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from .batching import encode_questions
+from .cache import get_question_cache
+from .conf import chatbot_setting
+from .index import KnowledgeIndex, get_index
+
+logger = logging.getLogger(__name__)
+
+
+def _question_embeddings(questions: List[str], cache) -> np.ndarray:
+    embeddings = [cache.get_embedding(question) if cache else None for question in questions]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        encoded = encode_questions([questions[i] for i in missing])
+        for i, embedding in zip(missing, encoded):
+            embeddings[i] = embedding
+            if cache:
+                cache.set_embedding(questions[i], embedding)
+    return np.stack(embeddings)
+
+def _search(questions: List[str], index: KnowledgeIndex, k: int, min_score: float, mode: str, cache) -> List[List[dict]]:
+    if mode == 'lexical':
+        return index.search_lexical(questions, k, min_score)
+    question_embeddings = _question_embeddings(questions, cache)
+    if mode == 'hybrid':
+        return index.search_hybrid(
+            questions, question_embeddings, k, min_score,
+            candidates=chatbot_setting('CHATBOT_LEXICAL_CANDIDATES'),
+            prefilter=chatbot_setting('CHATBOT_LEXICAL_PREFILTER'),
+        )
+    return index.search(question_embeddings, k, min_score)
+
+# Top-k matching chunks with scores and source offsets for each question, from one batched encode.
+# mode is 'dense' (embeddings only), 'lexical' (BM25 only, no encoder pass) or 'hybrid'
+def search_questions(questions: List[str], index: KnowledgeIndex, k: int = 1, min_score: float = 0.1,
+                     mode: Optional[str] = None) -> List[List[dict]]:
+    if not len(index):
+        return [[] for _ in questions]
+    mode = mode or chatbot_setting('CHATBOT_RETRIEVAL_MODE')
+
+    cache = get_question_cache()
+    if cache:
+        cache.use_version(index.version)
+    results = [None] * len(questions)
+    pending = []
+    for i, question in enumerate(questions):
+        found, hits = cache.get_answer(question, k, min_score, mode) if cache else (False, None)
+        if found:
+            results[i] = hits
+        else:
+            pending.append(i)
+    if not pending:
+        return results
+
+    for i, hits in zip(pending, _search([questions[i] for i in pending], index, k, min_score, mode, cache)):
+        results[i] = hits
+        if cache:
+            cache.set_answer(questions[i], hits, k, min_score, mode)
+    return results
+
+# Entry point for the views and the inference pool: a module-level function, so it can be pickled
+def answer_questions(questions: List[str], k: int = 1, min_score: float = 0.1, mode: Optional[str] = None) -> List[List[dict]]:
+    index = get_index()
+    if index is None:
+        return [[] for _ in questions]
+    return search_questions(questions, index, k, min_score, mode)
@@ -0,0 +1,81 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class FileFingerprint(NamedTuple):
+    mtime_ns: int
+    size: int
+    sha256: str
+
+
+def fingerprint(file_path: str, previous: Optional[FileFingerprint] = None) -> Optional[FileFingerprint]:
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    # Unchanged mtime and size: trust the previous hash instead of re-reading the file
+    if previous is not None and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size):
+        return previous
+    if os.path.isdir(file_path):
+        return FileFingerprint(stat.st_mtime_ns, stat.st_size, f'dir:{stat.st_mtime_ns}')
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return FileFingerprint(stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+
+class FileWatcher:
+    """Polls a set of files at most once per interval and calls on_change when any content changes.
+
+    `paths` may be a callable, re-evaluated on every check, so files can be added or removed.
+    A directory's fingerprint only tracks its mtime, which changes when entries are added or removed.
+    """
+
+    def __init__(self, paths: Union[List[str], Callable[[], List[str]]], on_change: Callable[[], None],
+                 interval: float = 2.0):
+        self.get_paths = paths if callable(paths) else (lambda: list(paths))
+        self.on_change = on_change
+        self.interval = interval
+        self._fingerprints: Dict[str, Optional[FileFingerprint]] = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    # Record the current state of every file without triggering a change
+    def prime(self) -> None:
+        with self._lock:
+            self._fingerprints = {path: fingerprint(path) for path in self.get_paths()}
+            self._next_check = time.monotonic() + self.interval
+
+    def check(self) -> bool:
+        if time.monotonic() < self._next_check:
+            return False
+        # Another request is already checking, there is nothing to wait for
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = time.monotonic() + self.interval
+            paths = self.get_paths()
+            changed = set(paths) != set(self._fingerprints)
+            for path in set(self._fingerprints) - set(paths):
+                del self._fingerprints[path]
+            for path in paths:
+                previous = self._fingerprints.get(path)
+                current = fingerprint(path, previous)
+                if current != previous:
+                    # A touch without a content change only refreshes mtime/size
+                    if previous is None or current is None or current.sha256 != previous.sha256:
+                        changed = True
+                    self._fingerprints[path] = current
+        finally:
+            self._lock.release()
+        if changed:
+            logger.info("Knowledge files changed, rebuilding the index.")
+            self.on_change()
+        return changed
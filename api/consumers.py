@@ -0,0 +1,50 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import ChatRoom
+from .realtime import chat_room_group, inbox_group
+
+
+class ChatRoomConsumer(AsyncJsonWebsocketConsumer):
+    """ws/chat_rooms/<chat_room_id>/: every new message of one room, as MessageSerializer data."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        self.chat_room_id = self.scope['url_route']['kwargs']['chat_room_id']
+        if user is None or not user.is_authenticated or not await self._is_member(user):
+            await self.close(code=4403)
+            return
+        self.group_name = chat_room_group(self.chat_room_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    @database_sync_to_async
+    def _is_member(self, user):
+        return ChatRoom.objects.filter(id=self.chat_room_id, users=user).exists()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def chat_message(self, event):
+        await self.send_json({'type': 'message', 'message': event['message']})
+
+
+class InboxConsumer(AsyncJsonWebsocketConsumer):
+    """ws/inbox/: a summary delta for each new message in any of the user's rooms."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group_name = inbox_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def inbox_update(self, event):
+        await self.send_json({'type': 'inbox', 'room': event['room']})
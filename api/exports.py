@@ -0,0 +1,62 @@
+# Streaming exports: rows are read with iterator() and written out one line at a time,
+# so memory use stays flat and the first bytes go out before the query finishes.
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .models import UserQuiz
+
+EXPORT_CHUNK_SIZE = 2000
+RESULT_FIELDS = ['id', 'user_id', 'user__username', 'user__first_name', 'answer', 'status', 'score', 'comment', 'created_at']
+RESULT_COLUMNS = ['id', 'user_id', 'username', 'first_name', 'answer', 'status', 'score', 'comment', 'created_at']
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+def quiz_result_rows(quiz_id):
+    # Same rows as UserQuizListView, as plain tuples without model instances
+    return (
+        UserQuiz.objects.filter(quiz_id=quiz_id, status="already_taken")
+        .order_by('id')
+        .values_list(*RESULT_FIELDS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+def _plain(row) -> list:
+    # created_at as ISO 8601 in both formats
+    return [value.isoformat() if isinstance(value, datetime) else value for value in row]
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(RESULT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(_plain(row))
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(RESULT_COLUMNS, _plain(row)))) + '\n'
+
+def _next_chunk(lines) -> list:
+    return list(islice(lines, EXPORT_CHUNK_SIZE))
+
+async def astream(lines):
+    """Async iterator over a sync line generator, for StreamingHttpResponse under ASGI.
+
+    Django reads a sync iterator to the end before sending anything from an ASGI server, so
+    the lines are pulled EXPORT_CHUNK_SIZE at a time through sync_to_async instead. Each pull
+    runs in the request's thread, which owns the database cursor behind iterator().
+    """
+    while chunk := await sync_to_async(_next_chunk)(lines):
+        for line in chunk:
+            yield line
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
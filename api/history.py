@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from django.db.models import Exists, Q, Subquery
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Message
+from .pagination import Keyset, get_limit, keyset_page, keyset_page_query
+from .serializers import MessageSerializer
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+# Backward pages run newest first
+HISTORY_KEY = Keyset(('timestamp', 'id'), (datetime, int))
+
+
+def message_history_query(chat_room_id, params):
+    """The message query for one page of a room's history; returns (queryset, limit, forward).
+
+    Backed by the (chat_room, timestamp, id) index. By default the newest messages
+    are returned, and `cursor` pages towards older ones. `after_id` (a message id)
+    or `since` (an ISO timestamp) switch to forward mode, returning only newer
+    messages so a polling client fetches just the delta; `after_id=0` starts from
+    the room's first message.
+    """
+    messages = Message.objects.filter(chat_room_id=chat_room_id)
+
+    after_id, since = params.get('after_id'), params.get('since')
+    if after_id or since:
+        limit = get_limit(params, default=HISTORY_PAGE_SIZE, maximum=HISTORY_MAX_PAGE_SIZE)
+        if after_id:
+            try:
+                after_id = int(after_id)
+            except ValueError:
+                raise ValidationError({'after_id': 'A valid integer is required.'})
+            anchor = Message.objects.filter(id=after_id)
+            timestamp = Subquery(anchor.values('timestamp')[:1])
+            # Without the anchor row (after_id=0 in an empty room, or a deleted message) ids are the best order left
+            messages = messages.filter(
+                Q(timestamp__gt=timestamp)
+                | Q(timestamp=timestamp, id__gt=after_id)
+                | Q(~Exists(anchor), id__gt=after_id)
+            )
+        if since:
+            try:
+                since_timestamp = parse_datetime(since)
+            except ValueError:
+                # Well formed but out of range, e.g. month 13
+                since_timestamp = None
+            if since_timestamp is None:
+                raise ValidationError({'since': 'A valid ISO 8601 datetime is required.'})
+            messages = messages.filter(timestamp__gt=since_timestamp)
+        return messages.order_by('timestamp', 'id')[:limit + 1], limit, True
+
+    messages, limit = keyset_page_query(
+        messages, params, HISTORY_KEY, default=HISTORY_PAGE_SIZE, maximum=HISTORY_MAX_PAGE_SIZE,
+    )
+    return messages, limit, False
+
+def message_history_page(chat_room_id, rows, limit, forward) -> dict:
+    # The cursor of a forward page is unused: the client polls from its newest message instead
+    rows, next_cursor = keyset_page(rows, limit, HISTORY_KEY)
+    if not forward:
+        # Fetched newest first; returned oldest first like the full history used to be
+        rows.reverse()
+    return {
+        'chat_room_id': chat_room_id,
+        'messages': MessageSerializer(rows, many=True).data,
+        'has_more': next_cursor is not None,
+        # Cursor for the next older page; only set when paging backwards
+        'next': None if forward else next_cursor,
+    }
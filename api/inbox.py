@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.db.models import F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import ChatRoom, ChatRoomReadState
+from .pagination import Keyset, keyset_page_query, keyset_results
+
+# The inbox order: last activity desc nulls last, then id desc
+INBOX_KEY = Keyset(('last_activity_at', 'id'), ((datetime, type(None)), int))
+
+
+def inbox_queryset(user):
+    """A user's chat rooms with the other participants and the latest message, newest activity first.
+
+    The latest message is read from the summary stored on ChatRoom, so this is one
+    scan of the last-activity index plus one prefetch of the other participants.
+    """
+    unread = ChatRoomReadState.objects.filter(chat_room=OuterRef('pk'), user=user).values('unread_count')[:1]
+    return (
+        ChatRoom.objects.filter(users=user)
+        .annotate(unread_count=Coalesce(Subquery(unread), 0))
+        .prefetch_related(Prefetch(
+            'users',
+            queryset=User.objects.exclude(id=user.id).only('id', 'first_name', 'username'),
+            to_attr='other_users',
+        ))
+        .order_by(F('last_activity_at').desc(nulls_last=True), '-id')
+    )
+
+def inbox_page_query(chat_rooms, params):
+    """The inbox query for one page; returns (queryset, limit).
+
+    Without limit/cursor the whole inbox is returned as a plain list, as before, and
+    limit is None; with them, pages follow the inbox order, keyed on (last activity, id).
+    """
+    return keyset_page_query(chat_rooms, params, INBOX_KEY, optional=True)
+
+def inbox_page(rows, limit):
+    return keyset_results(rows, limit, INBOX_KEY, lambda rooms: [serialize_room(room) for room in rooms])
+
+def serialize_room(room) -> dict:
+    return {
+        'id': room.id,
+        'other_users': [
+            {'id': other_user.id, 'first_name': other_user.first_name, 'username': other_user.username}
+            for other_user in room.other_users
+        ],
+        'latest_message': room.last_message_preview if room.last_activity_at else "No messages yet",
+        'timestamp': room.last_activity_at,
+        'unread_count': room.unread_count,
+    }
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.chat_summaries import backfill_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute every chat room's last-message summary and create missing unread counters."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed, created = backfill_summaries()
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {fixed} chat room summaries, created {created} read states.'
+        ))
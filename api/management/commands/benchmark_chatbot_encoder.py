@@ -0,0 +1,122 @@
+import gc
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.chatbot.backends import BACKENDS, LOADERS
+from api.chatbot.chunking import chunk_paragraphs
+from api.chatbot.conf import chatbot_setting
+from api.chatbot.documents import iter_paragraphs, list_knowledge_files
+
+DEFAULT_QUESTIONS = [
+    'What is financial literacy?',
+    'Why should I seek financial advice?',
+    'How do I build an emergency fund?',
+    'What is a budget?',
+    'How does credit card interest work?',
+    'What is APR?',
+    'How can I save for retirement?',
+    'What is amortization?',
+    'How do I reduce my debt?',
+    'What is the difference between saving and investing?',
+]
+
+
+def _rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = ('Compare chatbot encoder backends on the knowledge base: load time, memory, '
+            'question latency, chunk throughput and answer agreement with fp32 torch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed single-question encodes per question.')
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--questions', nargs='+', default=None, help='Questions used for latency and agreement.')
+        parser.add_argument('--min-cosine', type=float, default=0.98,
+                            help='Fail when a backend\'s mean cosine similarity to fp32 torch is below this.')
+
+    def handle(self, *args, **options):
+        files = [path for path in list_knowledge_files() if path.lower().endswith('.docx')]
+        if not files:
+            raise CommandError('No knowledge.docx found.')
+        chunks = [chunk['text'] for chunk in chunk_paragraphs(
+            iter_paragraphs(files[0]),
+            max_tokens=chatbot_setting('CHATBOT_CHUNK_TOKENS'),
+            overlap=chatbot_setting('CHATBOT_CHUNK_OVERLAP'),
+        )]
+        questions = options['questions'] or DEFAULT_QUESTIONS
+        name = chatbot_setting('CHATBOT_MODEL_NAME')
+        self.stdout.write(f'{len(chunks)} chunks from {files[0]}, {len(questions)} questions, model {name}.')
+
+        # Compare like with like: ONNX Runtime gets as many threads as torch uses
+        import torch
+
+        threads = torch.get_num_threads()
+        self.stdout.write(f'{threads} intra-op threads for every backend.')
+        failed = self._run(name, options, chunks, questions, threads)
+        self.stdout.write('Memory deltas are measured in one process; run one backend at a time for exact figures.')
+        if failed:
+            raise CommandError(
+                f"Embeddings of {', '.join(failed)} disagree with fp32 torch (mean cosine below {options['min_cosine']})."
+            )
+
+    def _run(self, name, options, chunks, questions, threads) -> list:
+        # fp32 torch is the reference every backend is compared against
+        backends = ['torch'] + [backend for backend in options['backends'] if backend != 'torch']
+        reference = None
+        failed = []
+        for backend in backends:
+            gc.collect()
+            rss_before = _rss_mb()
+            started = time.perf_counter()
+            model = LOADERS[backend](name, threads=threads) if backend == 'onnx' else LOADERS[backend](name)
+            load_seconds = time.perf_counter() - started
+
+            def encode(texts, model=model):
+                return np.asarray(model.encode(
+                    texts, batch_size=options['batch_size'], convert_to_numpy=True, normalize_embeddings=True,
+                ), dtype=np.float32)
+
+            encode(questions[:1])  # warm-up
+            latencies = []
+            for question in questions:
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    encode([question])
+                    latencies.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            chunk_embeddings = encode(chunks)
+            throughput = len(chunks) / (time.perf_counter() - started)
+            question_embeddings = encode(questions)
+            top1 = np.argmax(question_embeddings @ chunk_embeddings.T, axis=1)
+            rss_after = _rss_mb()
+
+            if reference is None:
+                reference = (chunk_embeddings, top1)
+            agreement = float(np.mean(top1 == reference[1]))
+            cosine = float(np.mean(np.sum(chunk_embeddings * reference[0], axis=1)))
+            latencies.sort()
+            self.stdout.write(
+                f'{backend:<11} load {load_seconds:6.2f}s  rss +{rss_after - rss_before:7.1f}MB  '
+                f'p50 {statistics.median(latencies):7.2f}ms  p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f}ms  '
+                f'{throughput:8.1f} chunks/s  top-1 agreement {agreement:6.1%}  mean cosine vs fp32 {cosine:.4f}'
+            )
+            if cosine < options['min_cosine']:
+                failed.append(backend)
+            # Free this backend before the next one is loaded and measured
+            del model, encode
+        return failed
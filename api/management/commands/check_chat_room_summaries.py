@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.chat_summaries import missing_read_states, summary_mismatches
+
+
+class Command(BaseCommand):
+    help = "Report chat rooms whose stored last-message summary or unread counters disagree with their messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Maximum number of problems to list.')
+
+    def handle(self, *args, **options):
+        problems = 0
+        for room, expected in summary_mismatches():
+            problems += 1
+            if problems <= options['limit']:
+                self.stdout.write(
+                    f'Room {room.id}: stored last_message={room.last_message_id} at {room.last_activity_at}, '
+                    f'expected {expected["last_message"]} at {expected["last_activity_at"]}'
+                )
+        for chat_room_id, user_id in missing_read_states():
+            problems += 1
+            if problems <= options['limit']:
+                self.stdout.write(f'Room {chat_room_id}: no read state for user {user_id}')
+        if problems:
+            raise CommandError(f'{problems} inconsistencies found; run backfill_chat_room_summaries to repair them.')
+        self.stdout.write(self.style.SUCCESS('All chat room summaries are consistent.'))
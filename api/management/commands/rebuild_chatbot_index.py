@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.chatbot.documents import list_knowledge_files
+from api.chatbot.index import build_index
+
+
+class Command(BaseCommand):
+    help = 'Ingest new or changed knowledge documents and rebuild the chatbot embedding index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-embed every document, not only new or changed ones.')
+
+    def handle(self, *args, **options):
+        files = list_knowledge_files()
+        if not files:
+            raise CommandError('No knowledge documents found; check CHATBOT_KNOWLEDGE_FILES and CHATBOT_KNOWLEDGE_DIRS.')
+        index = build_index(files, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Built knowledge index {index.key[:12]} with {len(index)} chunks from {len(files)} documents.'
+        ))
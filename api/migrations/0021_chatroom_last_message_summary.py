@@ -0,0 +1,85 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    ChatRoom = apps.get_model('api', 'ChatRoom')
+    ChatRoomReadState = apps.get_model('api', 'ChatRoomReadState')
+    Message = apps.get_model('api', 'Message')
+
+    latest = Message.objects.filter(chat_room=models.OuterRef('pk')).order_by('-timestamp', '-id')
+    rooms = ChatRoom.objects.annotate(
+        latest_id=models.Subquery(latest.values('id')[:1]),
+        latest_content=models.Subquery(latest.values('content')[:1]),
+        latest_timestamp=models.Subquery(latest.values('timestamp')[:1]),
+    ).filter(latest_id__isnull=False)
+    updated = []
+    for room in rooms.iterator(chunk_size=1000):
+        room.last_message_id = room.latest_id
+        room.last_message_preview = room.latest_content[:255]
+        room.last_activity_at = room.latest_timestamp
+        updated.append(room)
+    ChatRoom.objects.bulk_update(updated, ['last_message', 'last_message_preview', 'last_activity_at'], batch_size=1000)
+
+    ChatRoomReadState.objects.bulk_create(
+        [
+            ChatRoomReadState(chat_room_id=chat_room_id, user_id=user_id)
+            for chat_room_id, user_id in ChatRoom.users.through.objects.values_list('chatroom_id', 'user_id')
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_alter_userquiz_comment_alter_userquiz_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatRoomReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='chatroom_last_activity_idx'),
+        ),
+        migrations.AddField(
+            model_name='chatroomreadstate',
+            name='chat_room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='api.chatroom'),
+        ),
+        migrations.AddField(
+            model_name='chatroomreadstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_room_read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='chatroomreadstate',
+            unique_together={('chat_room', 'user')},
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_rooms(apps, chat_room_id, duplicate_ids):
+    # Earlier code could open several rooms for one pair; their history moves to the kept room
+    ChatRoom = apps.get_model('api', 'ChatRoom')
+    ChatRoomReadState = apps.get_model('api', 'ChatRoomReadState')
+    Message = apps.get_model('api', 'Message')
+
+    Message.objects.filter(chat_room_id__in=duplicate_ids).update(chat_room_id=chat_room_id)
+    unread = (
+        ChatRoomReadState.objects.filter(chat_room_id__in=duplicate_ids)
+        .values('user_id')
+        .annotate(total=models.Sum('unread_count'))
+        .values_list('user_id', 'total')
+    )
+    for user_id, total in unread:
+        read_state, _ = ChatRoomReadState.objects.get_or_create(chat_room_id=chat_room_id, user_id=user_id)
+        ChatRoomReadState.objects.filter(id=read_state.id).update(unread_count=models.F('unread_count') + total)
+
+    latest = Message.objects.filter(chat_room_id=chat_room_id).order_by('-timestamp', '-id').first()
+    ChatRoom.objects.filter(id=chat_room_id).update(
+        last_message=latest,
+        last_message_preview=latest.content[:255] if latest else '',
+        last_activity_at=latest.timestamp if latest else None,
+    )
+    ChatRoom.objects.filter(id__in=duplicate_ids).delete()
+
+def assign_direct_pairs(apps, schema_editor):
+    ChatRoom = apps.get_model('api', 'ChatRoom')
+    Membership = ChatRoom.users.through
+
+    members = {}
+    for chat_room_id, user_id in Membership.objects.values_list('chatroom_id', 'user_id').order_by('chatroom_id'):
+        members.setdefault(chat_room_id, []).append(user_id)
+
+    # Rooms of one or two users are direct rooms; duplicates of a pair are merged into the oldest one
+    pairs = {}
+    for chat_room_id, user_ids in sorted(members.items()):
+        if len(user_ids) <= 2:
+            pairs.setdefault((min(user_ids), max(user_ids)), []).append(chat_room_id)
+    rooms = []
+    for (user_low, user_high), chat_room_ids in pairs.items():
+        if len(chat_room_ids) > 1:
+            merge_rooms(apps, chat_room_ids[0], chat_room_ids[1:])
+        rooms.append(ChatRoom(id=chat_room_ids[0], user_low_id=user_low, user_high_id=user_high))
+    ChatRoom.objects.bulk_update(rooms, ['user_low', 'user_high'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_message_room_timestamp_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='user_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='user_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(assign_direct_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatroom',
+            constraint=models.UniqueConstraint(condition=models.Q(('user_low__isnull', False)), fields=('user_low', 'user_high'), name='unique_direct_chat_room'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_chatroom_direct_pair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userquiz',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
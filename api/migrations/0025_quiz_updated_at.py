@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-18 13:50
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    # The creation time is the best known change time of existing quizzes
+    Quiz = apps.get_model('api', 'Quiz')
+    Quiz.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_userquiz_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
@@ -16,17 +16,60 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s Profile"
 
 class ChatRoom(models.Model):
+    PREVIEW_LENGTH = 255
+
     users = models.ManyToManyField(User, related_name='chat_rooms')
+    # Summary of the latest message, kept up to date when messages are sent so the inbox never aggregates
+    last_message = models.ForeignKey('Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    # Canonical (lower id, higher id) pair of a direct-message room; null for rooms that are not direct
+    user_low = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-last_activity_at', '-id'], name='chatroom_last_activity_idx'),
+        ]
+        constraints = [
+            # At most one direct room per pair of users, even under concurrent first messages
+            models.UniqueConstraint(
+                fields=['user_low', 'user_high'],
+                condition=models.Q(user_low__isnull=False),
+                name='unique_direct_chat_room',
+            ),
+        ]
+
+    @staticmethod
+    def direct_pair(user_id, other_user_id):
+        return min(user_id, other_user_id), max(user_id, other_user_id)
 
     def __str__(self):
         return f'Chat Room with users: {", ".join(user.username for user in self.users.all())}'
 
+class ChatRoomReadState(models.Model):
+    chat_room = models.ForeignKey(ChatRoom, related_name='read_states', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='chat_room_read_states', on_delete=models.CASCADE)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('chat_room', 'user')
+
+    def __str__(self):
+        return f'{self.user.username}: {self.unread_count} unread in room {self.chat_room_id}'
+
 class Message(models.Model):
     chat_room = models.ForeignKey(ChatRoom, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a room's history on (timestamp, id)
+            models.Index(fields=['chat_room', 'timestamp', 'id'], name='message_room_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f'{self.sender.username}: {self.content}'
 
@@ -36,6 +79,8 @@ class Quiz(models.Model):
     title = models.CharField(max_length=10000)
     question = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Moved by every save, and by a new profile picture of the provider (see signals.py); versions the catalogue cache
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     def __str__(self):
         return self.title
 
@@ -47,6 +92,8 @@ class UserQuiz(models.Model):
     score = models.IntegerField(default=0)  # Use IntegerField if score is numeric
     created_at = models.DateTimeField(auto_now_add=True)
     comment = models.TextField(blank=True, null=True)
+    # Idempotency-Key header of the submitting request, so a retried submit gets the original result
+    idempotency_key = models.CharField(max_length=255, blank=True, null=True)
    
     class Meta:
         unique_together = ('user', 'quiz')  # Ensure that a user can only take the same quiz once
\ No newline at end of file
@@ -0,0 +1,48 @@
+# In-process registry of long-poll waiters, keyed by chat room id.
+import asyncio
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_waiters = defaultdict(set)
+
+
+class RoomWaiter:
+    """An asyncio event woken by the next notify_room() for the room, from any thread."""
+
+    def __init__(self, chat_room_id):
+        self.chat_room_id = chat_room_id
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def __enter__(self):
+        with _lock:
+            _waiters[self.chat_room_id].add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            waiters = _waiters.get(self.chat_room_id)
+            if waiters is not None:
+                waiters.discard(self)
+                if not waiters:
+                    del _waiters[self.chat_room_id]
+
+    async def wait(self, timeout) -> bool:
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+def notify_room(chat_room_id) -> None:
+    """Wake every waiter of the room in this process. Safe to call from sync code."""
+    with _lock:
+        waiters = list(_waiters.get(chat_room_id, ()))
+    for waiter in waiters:
+        try:
+            waiter.loop.call_soon_threadsafe(waiter.event.set)
+        except RuntimeError:
+            # The waiter's loop already closed, its request is gone
+            pass
@@ -0,0 +1,115 @@
+import base64
+import json
+from datetime import datetime
+from functools import reduce
+from operator import or_
+from typing import NamedTuple
+
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+# Opaque keyset cursors: the sort key of the last row of a page, e.g. (timestamp, id)
+def encode_cursor(*values) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, *slots) -> list:
+    """Decode a cursor of len(slots) values, each checked like isinstance(value, slot).
+
+    datetime slots are parsed from ISO strings; add type(None) to a slot that may be null.
+    Anything else, including a malformed date, is a 400 rather than a bad filter.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    if not isinstance(values, list) or len(values) != len(slots):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    decoded = []
+    for value, types in zip(values, slots):
+        types = types if isinstance(types, tuple) else (types,)
+        if datetime in types and isinstance(value, str):
+            try:
+                value = parse_datetime(value)
+            except ValueError:
+                value = None
+            if value is None:
+                raise ValidationError({'cursor': 'Invalid cursor.'})
+        if isinstance(value, bool) or not isinstance(value, types):
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+        decoded.append(value)
+    return decoded
+
+def get_limit(params, default: int = 20, maximum: int = 100) -> int:
+    try:
+        limit = int(params.get('limit', default))
+    except ValueError:
+        raise ValidationError({'limit': 'A valid integer is required.'})
+    return max(1, min(limit, maximum))
+
+
+class Keyset(NamedTuple):
+    """A descending sort key for keyset pages, e.g. Keyset(('created_at', 'id'), (datetime, int)).
+
+    fields are ordered on in descending order, nullable ones with nulls last; slots
+    check the decoded cursor values, as in decode_cursor.
+    """
+    fields: tuple
+    slots: tuple
+
+def _nullable(model, field: str) -> bool:
+    return model._meta.get_field(field).null
+
+def keyset_order(model, keyset: Keyset) -> list:
+    return [F(field).desc(nulls_last=True) if _nullable(model, field) else F(field).desc() for field in keyset.fields]
+
+def keyset_after(model, keyset: Keyset, values) -> Q:
+    # Rows strictly after the key `values` in keyset_order: equal on a prefix of the fields, lower on the next
+    conditions = []
+    equal = Q()
+    for field, value in zip(keyset.fields, values):
+        if value is None:
+            # Nulls sort last, so only other nulls can follow at this field
+            equal &= Q(**{f'{field}__isnull': True})
+            continue
+        lower = Q(**{f'{field}__lt': value})
+        if _nullable(model, field):
+            lower |= Q(**{f'{field}__isnull': True})
+        conditions.append(equal & lower)
+        equal &= Q(**{field: value})
+    return reduce(or_, conditions)
+
+def keyset_page_query(queryset, params, keyset: Keyset, default: int = 20, maximum: int = 100, optional: bool = False):
+    """The query for one page of queryset in keyset order; returns (queryset, limit).
+
+    `cursor` is the key of the previous page's last row. With optional, a request
+    without limit or cursor gets every row in the queryset's own order and limit is None.
+    """
+    if optional and 'limit' not in params and 'cursor' not in params:
+        return queryset, None
+    limit = get_limit(params, default=default, maximum=maximum)
+    queryset = queryset.order_by(*keyset_order(queryset.model, keyset))
+    if params.get('cursor'):
+        queryset = queryset.filter(keyset_after(queryset.model, keyset, decode_cursor(params['cursor'], *keyset.slots)))
+    # One extra row tells whether there is a next page
+    return queryset[:limit + 1], limit
+
+def keyset_page(rows, limit: int, keyset: Keyset) -> tuple:
+    """(the page's rows, the cursor of the next page or None) from the rows of keyset_page_query."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*(getattr(rows[-1], field) for field in keyset.fields))
+
+def keyset_results(rows, limit, keyset: Keyset, serialize):
+    # The response body: a plain list when not paging, as before, else {'next': cursor, 'results': [...]}
+    if limit is None:
+        return list(serialize(list(rows)))
+    rows, next_cursor = keyset_page(rows, limit, keyset)
+    return {
+        'next': next_cursor,
+        'results': list(serialize(rows)),
+    }
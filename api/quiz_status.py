@@ -0,0 +1,39 @@
+# The requesting user's status for many quizzes at once, replacing one check-quiz-status call per quiz.
+from django.db.models import F, FilteredRelation, Q
+
+from .models import UserQuiz
+
+NOT_TAKEN = {'status': 'not_taken', 'score': 0, 'answer': '', 'comment': ''}
+
+
+def taken_status(score, answer, comment) -> dict:
+    # Same shape as CheckQuizStatusView
+    return {'status': 'already_taken', 'score': score, 'answer': answer, 'comment': comment}
+
+def user_quiz_statuses(user, quiz_ids=None) -> list:
+    """[{quiz_id, status, score, answer, comment}] in one query over UserQuiz.
+
+    With quiz_ids every requested quiz gets an entry, not_taken when the user has
+    no submission; without, only the quizzes the user has taken are listed.
+    """
+    submissions = UserQuiz.objects.filter(user=user)
+    if quiz_ids is not None:
+        submissions = submissions.filter(quiz_id__in=quiz_ids)
+    taken = {
+        quiz_id: taken_status(score, answer, comment)
+        for quiz_id, score, answer, comment in submissions.values_list('quiz_id', 'score', 'answer', 'comment')
+    }
+    if quiz_ids is None:
+        return [{'quiz_id': quiz_id, **status} for quiz_id, status in sorted(taken.items())]
+    return [{'quiz_id': quiz_id, **taken.get(quiz_id, NOT_TAKEN)} for quiz_id in quiz_ids]
+
+def with_user_status(quizzes, user):
+    """Annotate each quiz with the user's submission through a single LEFT JOIN; see QuizWithStatusSerializer."""
+    return quizzes.annotate(
+        own_submission=FilteredRelation('user_quiz', condition=Q(user_quiz__user=user)),
+    ).annotate(
+        own_submission_id=F('own_submission__id'),
+        own_score=F('own_submission__score'),
+        own_answer=F('own_submission__answer'),
+        own_comment=F('own_submission__comment'),
+    )
@@ -0,0 +1,74 @@
+# Push new messages to WebSocket clients through the channel layer (see api/consumers.py)
+# and wake long-poll requests waiting on the room (see api/notifications.py).
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .chat_summaries import make_preview
+from .notifications import notify_room
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_CONCURRENCY = 500
+
+
+def chat_room_group(chat_room_id) -> str:
+    return f'chat_room_{chat_room_id}'
+
+def inbox_group(user_id) -> str:
+    return f'inbox_{user_id}'
+
+def publish_message(message, member_ids) -> None:
+    publish_messages([(message, member_ids)])
+
+def publish_messages(deliveries) -> None:
+    """Send each new message to its room's subscribers and an inbox delta to every member.
+
+    deliveries is a list of (message, member_ids). All sends are issued from one
+    event loop hop, PUBLISH_CONCURRENCY at a time, so a bulk send costs a few
+    batches of broker round trips rather than one round trip after another.
+    Call after the transaction commits, so subscribers never see a rolled-back message.
+    """
+    for message, _ in deliveries:
+        notify_room(message.chat_room_id)
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not deliveries:
+        return
+    # One list serializer builds the field set once instead of once per message
+    payloads = MessageSerializer([message for message, _ in deliveries], many=True).data
+    sends = []
+    for (message, member_ids), payload in zip(deliveries, payloads):
+        sends.append((chat_room_group(message.chat_room_id), {
+            'type': 'chat.message',
+            'message': payload,
+        }))
+        for user_id in member_ids:
+            sends.append((inbox_group(user_id), {
+                'type': 'inbox.update',
+                'room': {
+                    'id': message.chat_room_id,
+                    'latest_message': make_preview(message.content),
+                    'timestamp': payload['timestamp'],
+                    'sender': message.sender_id,
+                },
+            }))
+    try:
+        failed = async_to_sync(_group_send_all)(channel_layer, sends)
+    except Exception as e:
+        failed = [e]
+    if failed:
+        # Delivery is best effort; clients can always fall back to the history endpoints
+        logger.error(f"Error publishing {len(deliveries)} messages, {len(failed)} sends failed: {failed[0]}")
+
+async def _group_send_all(channel_layer, sends) -> list:
+    failed = []
+    for start in range(0, len(sends), PUBLISH_CONCURRENCY):
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, event) for group, event in sends[start:start + PUBLISH_CONCURRENCY]),
+            return_exceptions=True,
+        )
+        failed += [result for result in results if isinstance(result, Exception)]
+    return failed
@@ -0,0 +1,73 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .chat_summaries import create_read_states
+from .models import ChatRoom, ChatRoomReadState
+
+
+def find_direct_room(user_id, other_user_id):
+    # One lookup on the unique (user_low, user_high) index
+    user_low, user_high = ChatRoom.direct_pair(user_id, other_user_id)
+    return ChatRoom.objects.filter(user_low_id=user_low, user_high_id=user_high)
+
+def get_or_create_direct_room(user, other_user):
+    """The direct room between two users, created on first contact; returns (room, created).
+
+    The unique constraint settles concurrent first messages: the losing insert
+    rolls back to its savepoint and reads the winner's room.
+    """
+    chat_room = find_direct_room(user.id, other_user.id).first()
+    if chat_room is not None:
+        return chat_room, False
+    user_low, user_high = ChatRoom.direct_pair(user.id, other_user.id)
+    try:
+        with transaction.atomic():
+            chat_room = ChatRoom.objects.create(user_low_id=user_low, user_high_id=user_high)
+            chat_room.users.add(user, other_user)
+            create_read_states(chat_room, {user, other_user})
+    except IntegrityError:
+        return find_direct_room(user.id, other_user.id).get(), False
+    return chat_room, True
+
+def direct_room_ids(user_id, other_user_ids) -> dict:
+    """Map each of other_user_ids that already shares a direct room with user_id to that room's id."""
+    rooms = ChatRoom.objects.filter(
+        Q(user_low_id=user_id, user_high_id__in=other_user_ids) | Q(user_high_id=user_id, user_low_id__in=other_user_ids)
+    ).values_list('id', 'user_low_id', 'user_high_id')
+    return {user_low if user_high == user_id else user_high: room_id for room_id, user_low, user_high in rooms}
+
+def get_or_create_direct_rooms(user_id, other_user_ids, batch_size: int = 500) -> dict:
+    """Batched get_or_create_direct_room; maps every id in other_user_ids to its direct room's id.
+
+    Runs a fixed number of queries however many users there are. Missing rooms
+    are inserted with ON CONFLICT DO NOTHING, so rooms created concurrently by a
+    single send are simply picked up by the re-read. Call inside a transaction.
+    """
+    room_ids = direct_room_ids(user_id, other_user_ids)
+    missing = [other_user_id for other_user_id in other_user_ids if other_user_id not in room_ids]
+    if not missing:
+        return room_ids
+
+    pairs = [ChatRoom.direct_pair(user_id, other_user_id) for other_user_id in missing]
+    ChatRoom.objects.bulk_create(
+        [ChatRoom(user_low_id=user_low, user_high_id=user_high) for user_low, user_high in pairs],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    created = direct_room_ids(user_id, missing)
+    # Membership and read states of rooms a concurrent send created already exist; the conflicts are ignored
+    Membership = ChatRoom.users.through
+    Membership.objects.bulk_create(
+        [Membership(chatroom_id=room_id, user_id=member_id)
+         for other_user_id, room_id in created.items() for member_id in {user_id, other_user_id}],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    ChatRoomReadState.objects.bulk_create(
+        [ChatRoomReadState(chat_room_id=room_id, user_id=member_id)
+         for other_user_id, room_id in created.items() for member_id in {user_id, other_user_id}],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    room_ids.update(created)
+    return room_ids
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/chat_rooms/<int:chat_room_id>/', consumers.ChatRoomConsumer.as_asgi()),
+    path('ws/inbox/', consumers.InboxConsumer.as_asgi()),
+]
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import UserProfile, Message, ChatRoom, Quiz, UserQuiz
+from .chatbot.conf import chatbot_setting
+from .quiz_status import NOT_TAKEN, taken_status
 
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,9 +23,42 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """The few user fields a chat room, quiz or submission shows, for nesting instead of UserSerializer.
 
-class ChatRoomSerializer(serializers.ModelSerializer):
-    users = UserSerializer(many=True, read_only=True)
+    Select or prefetch the user together with profile_pic to keep lists to a fixed number of queries.
+    """
+    profile_pic = UserProfileSerializer(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'profile_pic', 'is_superuser']
+        read_only_fields = fields
+
+
+class SparseFieldsetMixin:
+    """Limits a GET response to the comma-separated `?fields=` names, e.g. `?fields=id,title`.
+
+    Only the top-level serializer (or each item of a top-level list) is trimmed;
+    unknown names are ignored.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if request is None or parent is not None or request.method != 'GET':
+            return fields
+        # A DRF request, or the plain HttpRequest of the async views
+        requested = getattr(request, 'query_params', request.GET).get('fields')
+        if not requested:
+            return fields
+        names = {name.strip() for name in requested.split(',')}
+        return {name: field for name, field in fields.items() if name in names}
+
+
+class ChatRoomSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    users = UserSummarySerializer(many=True, read_only=True)
 
     class Meta:
         model = ChatRoom
@@ -38,8 +73,24 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'chat_room', 'sender', 'content', 'timestamp']
         
 
-class QuizSerializer(serializers.ModelSerializer):
-    provider = UserSerializer(read_only=True)  # Use UserSerializer for nested user representation
+# Largest BigAutoField key; a bigger id would overflow the database integer instead of matching nothing
+MAX_ID = 2 ** 63 - 1
+
+
+class BulkMessageSerializer(serializers.Serializer):
+    MAX_RECIPIENTS = 10000
+
+    receiver_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID), allow_empty=False, max_length=MAX_RECIPIENTS,
+    )
+    content = serializers.CharField()
+
+    def validate_receiver_ids(self, value):
+        return list(dict.fromkeys(value))  # Drop duplicates, keep the order
+
+
+class QuizSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    provider = UserSummarySerializer(read_only=True)
 
     class Meta:
         model = Quiz
@@ -51,6 +102,18 @@ class QuizSerializer(serializers.ModelSerializer):
             validated_data['provider'] = request.user  # Set the provider to the current logged-in user
         return Quiz.objects.create(**validated_data)
     
+class QuizWithStatusSerializer(QuizSerializer):
+    """QuizSerializer plus the requesting user's status, read from the with_user_status() annotations."""
+    user_status = serializers.SerializerMethodField()
+
+    class Meta(QuizSerializer.Meta):
+        fields = QuizSerializer.Meta.fields + ['user_status']
+
+    def get_user_status(self, quiz):
+        if quiz.own_submission_id is None:
+            return dict(NOT_TAKEN)
+        return taken_status(quiz.own_score, quiz.own_answer, quiz.own_comment)
+
 class UserQuizSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # Read-only
     quiz = serializers.PrimaryKeyRelatedField(queryset=Quiz.objects.all())  # Accept quiz ID
@@ -60,8 +123,54 @@ class UserQuizSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'quiz', 'answer', 'status', 'score', 'created_at', 'comment']
         
 
-class UserQuizDetailSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)  # Nested UserDetailSerializer
+class QuizStatusQuerySerializer(serializers.Serializer):
+    MAX_IDS = 500
+
+    # ?ids=1,2,3, split on commas by the view
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID), allow_empty=False, max_length=MAX_IDS,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class QuizSubmissionSerializer(serializers.ModelSerializer):
+    # The user and quiz come from the request and the URL, so validation never loads the quiz
+
+    class Meta:
+        model = UserQuiz
+        fields = ['answer', 'status', 'score', 'comment']
+
+
+class GradeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = UserQuiz
+        fields = ['id', 'score', 'status', 'comment']
+        extra_kwargs = {'score': {'required': False}, 'status': {'required': False}}
+
+    def validate(self, attrs):
+        if not set(attrs) & {'score', 'status', 'comment'}:
+            raise serializers.ValidationError('Give at least one of score, status or comment.')
+        return attrs
+
+
+class BulkGradeSerializer(serializers.Serializer):
+    MAX_UPDATES = 5000
+
+    updates = GradeSerializer(many=True, allow_empty=False, max_length=MAX_UPDATES)
+
+    def validate_updates(self, value):
+        ids = [update['id'] for update in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Each submission may only be graded once per request.')
+        return value
+
+
+class UserQuizDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    user = UserSummarySerializer(read_only=True)
 
     class Meta:
         model = UserQuiz
@@ -69,5 +178,31 @@ class UserQuizDetailSerializer(serializers.ModelSerializer):
         
         
 
-class ChatbotSerializer(serializers.Serializer):
-    question = serializers.CharField()
\ No newline at end of file
+class ChatbotSearchOptionsMixin(serializers.Serializer):
+    k = serializers.IntegerField(default=1, min_value=1)
+    # Cosine similarity in dense and hybrid mode, raw BM25 score in lexical mode
+    min_score = serializers.FloatField(default=0.1, min_value=-1.0)
+    mode = serializers.ChoiceField(
+        choices=['dense', 'lexical', 'hybrid'],
+        default=lambda: chatbot_setting('CHATBOT_RETRIEVAL_MODE'),
+    )
+
+    def validate_k(self, value):
+        max_k = chatbot_setting('CHATBOT_MAX_K')
+        if value > max_k:
+            raise serializers.ValidationError(f'k can be at most {max_k}.')
+        return value
+
+
+class ChatbotSerializer(ChatbotSearchOptionsMixin):
+    question = serializers.CharField()
+
+
+class ChatbotBatchSerializer(ChatbotSearchOptionsMixin):
+    questions = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_questions(self, value):
+        max_questions = chatbot_setting('CHATBOT_BATCH_MAX_QUESTIONS')
+        if len(value) > max_questions:
+            raise serializers.ValidationError(f'At most {max_questions} questions can be sent at once.')
+        return value
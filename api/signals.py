@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Quiz, UserProfile
+
+
+# The catalogue nests each provider's profile picture, so a new picture is a change to their quizzes
+@receiver(post_save, sender=UserProfile)
+def touch_provider_quizzes(sender, instance, **kwargs):
+    Quiz.objects.filter(provider_id=instance.user_id).update(updated_at=timezone.now())
@@ -1,3 +1,1346 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from docx import Document
+import numpy as np
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .chatbot import cache as cache_module, encoder as encoder_module, index as index_module
+from .chatbot.backends import LOADERS, ONNX_EXPORT_VERSION, OnnxEncoder, load_onnx
+from .chatbot.batching import MicroBatcher
+from .chatbot.cache import LocalLRUCache, QuestionCache
+from .chatbot.chunking import chunk_paragraphs, count_tokens
+from .chatbot.documents import Paragraph
+from .chatbot.encoder import get_model
+from .chatbot.executor import ExecutorBusy, ExecutorFailed, ExecutorTimeout, ProcessExecutor
+from .chatbot.index import KnowledgeIndex, get_index, load_index, load_or_build_index, set_index
+from .chatbot.ingest import hash_file
+from .chatbot.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from .chatbot.retrieval import ExactSearch, IVFSearch, build_searcher
+from .chatbot.service import answer_questions
+from .chatbot.watcher import FileWatcher
+from .chat_summaries import backfill_summaries, mark_read, missing_read_states, record_message, summary_mismatches
+from .models import ChatRoom, ChatRoomReadState, Message, Quiz, UserProfile, UserQuiz
+from .pagination import encode_cursor
+from .rooms import get_or_create_direct_room
+from .routing import websocket_urlpatterns
+from .serializers import QuizStatusQuerySerializer
+from .ws_auth import JWTAuthMiddleware
+
+
+class QuizCatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.provider = User.objects.create_user(username='provider', password='secret')
+        self.quizzes = [Quiz.objects.create(provider=self.provider, title=f'Quiz {i}', question='?') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider)
+
+    def test_full_list_without_paging_parameters(self):
+        response = self.client.get('/api/quizzes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+
+    def test_cursor_pages_cover_every_quiz_newest_first(self):
+        seen = []
+        url = '/api/quizzes/?limit=2'
+        while url:
+            response = self.client.get(url)
+            seen += [quiz['id'] for quiz in response.data['results']]
+            url = response.data['next'] and f"/api/quizzes/?limit=2&cursor={response.data['next']}"
+        self.assertEqual(seen, [quiz.id for quiz in reversed(self.quizzes)])
+
+    def test_unchanged_catalogue_is_not_modified(self):
+        etag = self.client.get('/api/quizzes/')['ETag']
+        response = self.client.get('/api/quizzes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_made_elsewhere_invalidate(self):
+        # Queryset updates and deletes bypass signals, as do writes from another process
+        etag = self.client.get('/api/quizzes/')['ETag']
+        Quiz.objects.filter(id=self.quizzes[0].id).update(title='Changed', updated_at=timezone.now())
+        response = self.client.get('/api/quizzes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Changed', [quiz['title'] for quiz in response.data])
+
+        etag = response['ETag']
+        Quiz.objects.filter(id=self.quizzes[1].id).delete()
+        response = self.client.get('/api/quizzes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+
+    def test_new_profile_picture_invalidates(self):
+        etag = self.client.get('/api/quizzes/')['ETag']
+        UserProfile.objects.create(user=self.provider)
+        self.assertEqual(self.client.get('/api/quizzes/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CursorValidationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.other = User.objects.create_user(username='bob', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/create-chat/{self.other.id}/', {'content': 'Hello'}, format='json')
+        Quiz.objects.create(provider=self.user, title='Quiz', question='?')
+
+    def test_malformed_cursors_are_rejected(self):
+        urls = [
+            '/api/quizzes/',
+            '/api/my-chat-rooms/',
+            f'/api/chat_rooms/{self.other.id}/{self.user.id}/',
+        ]
+        cursors = [
+            'not base64 json',
+            encode_cursor('yesterday', 1),
+            encode_cursor('2024-13-45T00:00:00', 1),
+            encode_cursor('2024-01-01T00:00:00+00:00', 'x'),
+            encode_cursor('2024-01-01T00:00:00+00:00', True),
+            encode_cursor('2024-01-01T00:00:00+00:00'),
+        ]
+        for url in urls:
+            for cursor in cursors:
+                with self.subTest(url=url, cursor=cursor):
+                    self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400)
+
+    def test_null_timestamp_only_where_allowed(self):
+        # Rooms without messages sort last in the inbox, so its cursor may carry a null timestamp
+        self.assertEqual(self.client.get('/api/my-chat-rooms/', {'cursor': encode_cursor(None, 1)}).status_code, 200)
+        self.assertEqual(self.client.get('/api/quizzes/', {'cursor': encode_cursor(None, 1)}).status_code, 400)
+
+    def test_valid_cursor(self):
+        response = self.client.get('/api/quizzes/', {'cursor': encode_cursor(timezone.now(), 10 ** 6)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_inbox_pages_run_into_rooms_without_messages(self):
+        empty = [ChatRoom.objects.create() for _ in range(3)]
+        for room in empty:
+            room.users.add(self.user)
+        # The room with a message first, then the empty ones newest first
+        expected = [ChatRoom.objects.get(last_activity_at__isnull=False).id] + [room.id for room in reversed(empty)]
+        seen, url = [], '/api/my-chat-rooms/?limit=1'
+        while url:
+            response = self.client.get(url)
+            seen += [room['id'] for room in response.data['results']]
+            url = response.data['next'] and f"/api/my-chat-rooms/?limit=1&cursor={response.data['next']}"
+        self.assertEqual(seen, expected)
+
+
+class MessageHistoryDeltaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.other = User.objects.create_user(username='bob', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for content in ('one', 'two', 'three'):
+            self.client.post(f'/api/create-chat/{self.other.id}/', {'content': content}, format='json')
+        self.messages = list(Message.objects.order_by('id'))
+        self.url = f'/api/chat_rooms/{self.other.id}/{self.user.id}/'
+
+    def delta(self, after_id):
+        response = self.client.get(self.url, {'after_id': after_id})
+        self.assertEqual(response.status_code, 200)
+        return [message['content'] for message in response.data[0]['messages']]
+
+    def test_after_real_id(self):
+        self.assertEqual(self.delta(self.messages[0].id), ['two', 'three'])
+        self.assertEqual(self.delta(self.messages[-1].id), [])
+
+    def test_after_zero_returns_everything(self):
+        self.assertEqual(self.delta(0), ['one', 'two', 'three'])
+
+    def test_after_unknown_or_deleted_id_falls_back_to_ids(self):
+        self.assertEqual(self.delta(10 ** 6), [])
+        deleted_id = self.messages[1].id
+        Message.objects.filter(id=deleted_id).delete()
+        self.assertEqual(self.delta(deleted_id), ['three'])
+
+    def test_after_id_must_be_an_integer(self):
+        self.assertEqual(self.client.get(self.url, {'after_id': 'x'}).status_code, 400)
+
+    def test_since_must_be_a_valid_datetime(self):
+        for since in ('yesterday', '2024-13-45T00:00:00'):
+            response = self.client.get(self.url, {'since': since})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('since', response.data)
+
+
+class WaitForMessagesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.other = User.objects.create_user(username='bob', password='secret')
+        self.chat_room, _ = get_or_create_direct_room(self.user, self.other)
+        self.url = f'/api/async/chat_rooms/{self.chat_room.id}/wait/'
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.other)}'}
+
+    def send(self, content):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Publishing, and so waking the waiters, happens on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'/api/create-chat/{self.other.id}/', {'content': content}, format='json')
+
+    async def test_empty_room_wakes_on_first_message(self):
+        async def send_later():
+            await asyncio.sleep(0.2)
+            await sync_to_async(self.send)('first')
+
+        task = asyncio.ensure_future(send_later())
+        response = await self.async_client.get(self.url, {'after_id': 0, 'timeout': 10}, headers=self.headers)
+        await task
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['content'] for message in response.json()['messages']], ['first'])
+
+    async def test_returns_empty_page_on_timeout(self):
+        await sync_to_async(self.send)('first')
+        last_id = await Message.objects.filter(chat_room=self.chat_room).values_list('id', flat=True).alast()
+        response = await self.async_client.get(self.url, {'after_id': last_id, 'timeout': 0.2}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['messages'], [])
+
+    async def test_after_id_is_required(self):
+        response = await self.async_client.get(self.url, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_timeout_must_be_finite_and_non_negative(self):
+        for timeout in ('nan', 'inf', '-1', 'soon'):
+            response = await self.async_client.get(self.url, {'after_id': 0, 'timeout': timeout}, headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+
+
+class SubmitQuizAnswerTests(TestCase):
+    def setUp(self):
+        provider = User.objects.create_user(username='provider', password='secret')
+        self.user = User.objects.create_user(username='student', password='secret')
+        self.quiz = Quiz.objects.create(provider=provider, title='Quiz', question='?')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, quiz_id, **headers):
+        return self.client.post(
+            f'/api/submit-answer/{quiz_id}/', {'answer': '42', 'status': 'already_taken'}, format='json', headers=headers,
+        )
+
+    def test_submit(self):
+        response = self.submit(self.quiz.id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quiz'], self.quiz.id)
+        self.assertEqual(UserQuiz.objects.filter(user=self.user, quiz=self.quiz).count(), 1)
+
+    def test_duplicate_submit_is_rejected(self):
+        self.submit(self.quiz.id)
+        response = self.submit(self.quiz.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserQuiz.objects.filter(user=self.user, quiz=self.quiz).count(), 1)
+
+    def test_idempotent_replay(self):
+        first = self.submit(self.quiz.id, **{'Idempotency-Key': 'abc'})
+        retry = self.submit(self.quiz.id, **{'Idempotency-Key': 'abc'})
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(self.submit(self.quiz.id, **{'Idempotency-Key': 'other'}).status_code, 400)
+
+    def test_unknown_quiz_inside_an_outer_transaction(self):
+        # TestCase holds a transaction open, like ATOMIC_REQUESTS would
+        response = self.submit(10 ** 6)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(UserQuiz.objects.filter(user=self.user).exists())
+
+
+class QuizStatusListTests(TestCase):
+    def setUp(self):
+        provider = User.objects.create_user(username='provider', password='secret')
+        self.user = User.objects.create_user(username='student', password='secret')
+        self.quizzes = [Quiz.objects.create(provider=provider, title=f'Quiz {i}', question='?') for i in range(2)]
+        UserQuiz.objects.create(user=self.user, quiz=self.quizzes[0], answer='42', status='already_taken', score=7)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def statuses(self, **params):
+        return self.client.get('/api/quiz-statuses/', params)
+
+    def test_taken_quizzes(self):
+        response = self.statuses()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['quiz_id'], row['status'], row['score']) for row in response.data], [(self.quizzes[0].id, 'already_taken', 7)],
+        )
+
+    def test_requested_ids_in_order(self):
+        ids = f'{self.quizzes[1].id},{self.quizzes[0].id},{self.quizzes[1].id}'
+        response = self.statuses(ids=ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['quiz_id'], row['status']) for row in response.data],
+            [(self.quizzes[1].id, 'not_taken'), (self.quizzes[0].id, 'already_taken')],
+        )
+
+    def test_invalid_ids(self):
+        too_many = ','.join(str(i) for i in range(1, QuizStatusQuerySerializer.MAX_IDS + 2))
+        for ids in ('1,x', '0', '99999999999999999999999', too_many):
+            response = self.statuses(ids=ids)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('ids', response.data)
+
+
+class BulkGradeTests(TestCase):
+    def setUp(self):
+        self.provider = User.objects.create_user(username='provider', password='secret')
+        other_provider = User.objects.create_user(username='other', password='secret')
+        quiz = Quiz.objects.create(provider=self.provider, title='Quiz', question='?')
+        other_quiz = Quiz.objects.create(provider=other_provider, title='Other', question='?')
+        students = [User.objects.create_user(username=f'student{i}', password='secret') for i in range(2)]
+        self.submissions = [UserQuiz.objects.create(user=student, quiz=quiz, answer='42', status='already_taken') for student in students]
+        self.foreign = UserQuiz.objects.create(user=students[0], quiz=other_quiz, answer='41', status='already_taken')
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider)
+
+    def grade(self, updates):
+        return self.client.post('/api/userquiz/bulk-update/', {'updates': updates}, format='json')
+
+    def scores(self):
+        return list(UserQuiz.objects.order_by('id').values_list('score', flat=True))
+
+    def test_grades_every_submission(self):
+        response = self.grade([
+            {'id': self.submissions[0].id, 'score': 8, 'comment': 'Good'},
+            {'id': self.submissions[1].id, 'score': 5},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(self.scores(), [8, 5, 0])
+        self.assertEqual(UserQuiz.objects.get(id=self.submissions[0].id).comment, 'Good')
+
+    def test_update_without_fields_is_rejected(self):
+        response = self.grade([{'id': self.submissions[0].id}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_providers_submissions_fail_the_whole_batch(self):
+        response = self.grade([{'id': self.submissions[0].id, 'score': 8}, {'id': self.foreign.id, 'score': 9}])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['ids'], [self.foreign.id])
+        self.assertEqual(self.scores(), [0, 0, 0])
+
+    def test_missing_ids_fail_the_whole_batch(self):
+        response = self.grade([{'id': self.submissions[0].id, 'score': 8}, {'id': 10 ** 6, 'score': 9}])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['ids'], [10 ** 6])
+        self.assertEqual(self.scores(), [0, 0, 0])
+
+    def test_invalid_rows_and_duplicates_fail_the_whole_batch(self):
+        first = {'id': self.submissions[0].id, 'score': 8}
+        self.assertEqual(self.grade([first, {'id': self.submissions[1].id, 'score': 'x'}]).status_code, 400)
+        self.assertEqual(self.grade([first, {'id': self.submissions[0].id, 'score': 9}]).status_code, 400)
+        self.assertEqual(self.scores(), [0, 0, 0])
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs a data migration on rows created with the models of the migration before it."""
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.apps = self.migrate_app(self.migrate_from)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate_app(self, migration):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', migration)])
+        return executor.loader.project_state([('api', migration)]).apps
+
+    def run_migration(self):
+        return self.migrate_app(self.migrate_to)
+
+
+class DirectPairMigrationTests(MigrationTestCase):
+    migrate_from = '0022_message_room_timestamp_index'
+    migrate_to = '0023_chatroom_direct_pair'
+
+    def test_duplicate_rooms_are_merged_into_the_oldest(self):
+        User = self.apps.get_model('auth', 'User')
+        ChatRoom = self.apps.get_model('api', 'ChatRoom')
+        ChatRoomReadState = self.apps.get_model('api', 'ChatRoomReadState')
+        Message = self.apps.get_model('api', 'Message')
+        alice = User.objects.create(username='alice')
+        bob = User.objects.create(username='bob')
+        carol = User.objects.create(username='carol')
+        rooms = []
+        for content, unread in (('first', 1), ('second', 2)):
+            room = ChatRoom.objects.create()
+            room.users.add(alice, bob)
+            message = Message.objects.create(chat_room=room, sender=alice, content=content)
+            room.last_message, room.last_message_preview, room.last_activity_at = message, content, message.timestamp
+            room.save()
+            ChatRoomReadState.objects.create(chat_room=room, user=alice)
+            ChatRoomReadState.objects.create(chat_room=room, user=bob, unread_count=unread)
+            rooms.append(room)
+        group = ChatRoom.objects.create()
+        group.users.add(alice, bob, carol)
+
+        apps = self.run_migration()
+        ChatRoom = apps.get_model('api', 'ChatRoom')
+        Message = apps.get_model('api', 'Message')
+        ChatRoomReadState = apps.get_model('api', 'ChatRoomReadState')
+        kept = ChatRoom.objects.get(id=rooms[0].id)
+        self.assertEqual((kept.user_low_id, kept.user_high_id), (alice.id, bob.id))
+        self.assertFalse(ChatRoom.objects.filter(id=rooms[1].id).exists())
+        self.assertEqual(
+            list(Message.objects.filter(chat_room=kept).order_by('id').values_list('content', flat=True)),
+            ['first', 'second'],
+        )
+        self.assertEqual(kept.last_message_preview, 'second')
+        self.assertEqual(ChatRoomReadState.objects.get(chat_room=kept, user_id=bob.id).unread_count, 3)
+        # Group rooms are not direct rooms
+        self.assertIsNone(ChatRoom.objects.get(id=group.id).user_low_id)
+
+
+class SummaryBackfillMigrationTests(MigrationTestCase):
+    migrate_from = '0020_alter_userquiz_comment_alter_userquiz_status'
+    migrate_to = '0021_chatroom_last_message_summary'
+
+    def test_summaries_and_read_states_are_backfilled(self):
+        User = self.apps.get_model('auth', 'User')
+        ChatRoom = self.apps.get_model('api', 'ChatRoom')
+        Message = self.apps.get_model('api', 'Message')
+        alice = User.objects.create(username='alice')
+        bob = User.objects.create(username='bob')
+        room = ChatRoom.objects.create()
+        room.users.add(alice, bob)
+        empty = ChatRoom.objects.create()
+        empty.users.add(alice)
+        for content in ('older', 'x' * 300):
+            latest = Message.objects.create(chat_room=room, sender=alice, content=content)
+
+        apps = self.run_migration()
+        ChatRoom = apps.get_model('api', 'ChatRoom')
+        ChatRoomReadState = apps.get_model('api', 'ChatRoomReadState')
+        room = ChatRoom.objects.get(id=room.id)
+        self.assertEqual(room.last_message_id, latest.id)
+        self.assertEqual(room.last_message_preview, 'x' * 255)
+        self.assertEqual(room.last_activity_at, latest.timestamp)
+        self.assertIsNone(ChatRoom.objects.get(id=empty.id).last_activity_at)
+        self.assertEqual(
+            sorted(ChatRoomReadState.objects.values_list('chat_room_id', 'user_id', 'unread_count')),
+            sorted([(room.id, alice.id, 0), (room.id, bob.id, 0), (empty.id, alice.id, 0)]),
+        )
+
+
+class ChatSummaryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='secret')
+        self.bob = User.objects.create_user(username='bob', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def send(self, content):
+        self.client.post(f'/api/create-chat/{self.bob.id}/', {'content': content}, format='json')
+        return Message.objects.latest('id')
+
+    def unread(self, user):
+        return ChatRoomReadState.objects.get(user=user).unread_count
+
+    def test_sending_keeps_the_summary_consistent(self):
+        self.send('hello')
+        message = self.send('how are you?')
+        room = ChatRoom.objects.get()
+        self.assertEqual(room.last_message_id, message.id)
+        self.assertEqual(room.last_message_preview, 'how are you?')
+        self.assertEqual(list(summary_mismatches()), [])
+        self.assertFalse(missing_read_states().exists())
+        self.assertEqual((self.unread(self.alice), self.unread(self.bob)), (0, 2))
+
+    def test_an_older_message_does_not_overwrite_a_newer_summary(self):
+        older = self.send('older')
+        newer = self.send('newer')
+        # A slower concurrent send that commits last
+        record_message(older)
+        self.assertEqual(ChatRoom.objects.get().last_message_id, newer.id)
+
+    def test_reading_clears_unread(self):
+        message = self.send('hello')
+        mark_read(message.chat_room_id, self.bob.id)
+        self.assertEqual(self.unread(self.bob), 0)
+
+    def test_backfill_repairs_drift(self):
+        self.send('hello')
+        message = self.send('world')
+        ChatRoom.objects.update(last_message=None, last_message_preview='', last_activity_at=None)
+        ChatRoomReadState.objects.filter(user=self.bob).delete()
+        with self.assertRaises(CommandError):
+            call_command('check_chat_room_summaries', stdout=StringIO())
+
+        self.assertEqual(backfill_summaries(), (1, 1))
+        self.assertEqual(ChatRoom.objects.get().last_message_id, message.id)
+        call_command('check_chat_room_summaries', stdout=StringIO())
+
+
+class BulkMessageTests(TestCase):
+    def setUp(self):
+        self.advisor = User.objects.create_user(username='advisor', password='secret', is_superuser=True)
+        self.recipients = [User.objects.create_user(username=f'client{i}', password='secret') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.advisor)
+
+    def test_results_per_recipient(self):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'inbox_{self.recipients[0].id}', channel)
+        # An existing room is reused, the others are created
+        get_or_create_direct_room(self.advisor, self.recipients[1])
+        receiver_ids = [user.id for user in self.recipients] + [self.advisor.id, 10 ** 6]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/send-bulk-message/', {'receiver_ids': receiver_ids, 'content': 'Notice'}, format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sent'], 3)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']], ['sent', 'sent', 'sent', 'skipped', 'not_found'],
+        )
+        self.assertEqual(ChatRoom.objects.count(), 3)
+        self.assertEqual(Message.objects.filter(content='Notice').count(), 3)
+        self.assertEqual(list(summary_mismatches()), [])
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['room']['latest_message'], 'Notice')
+
+    def test_ids_beyond_the_key_range_are_rejected(self):
+        response = self.client.post('/api/send-bulk-message/', {'receiver_ids': [10 ** 30], 'content': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_advisors_only(self):
+        self.client.force_authenticate(self.recipients[0])
+        response = self.client.post('/api/send-bulk-message/', {'receiver_ids': [self.advisor.id], 'content': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class QuizResultsExportTests(TestCase):
+    def setUp(self):
+        self.provider = User.objects.create_user(username='provider', password='secret')
+        self.student = User.objects.create_user(username='student', password='secret', first_name='Sam')
+        self.quiz = Quiz.objects.create(provider=self.provider, title='Quiz', question='?')
+        self.result = UserQuiz.objects.create(user=self.student, quiz=self.quiz, answer='42', status='already_taken', score=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider)
+
+    def test_csv(self):
+        response = self.client.get(f'/api/quizzes/{self.quiz.id}/results.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,user_id,username,first_name,answer,status,score,comment,created_at')
+        self.assertEqual(lines[1].split(',')[:7], [str(self.result.id), str(self.student.id), 'student', 'Sam', '42', 'already_taken', '10'])
+        self.assertEqual(len(lines), 2)
+
+    async def test_jsonl_streams_asynchronously_under_asgi(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.provider)}'}
+        response = await self.async_client.get(f'/api/quizzes/{self.quiz.id}/results.jsonl', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(response.is_async)
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual([(line['id'], line['username'], line['answer']) for line in lines], [(self.result.id, 'student', '42')])
+
+    def test_provider_only(self):
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(f'/api/quizzes/{self.quiz.id}/results.csv').status_code, 403)
+        self.assertEqual(self.client.get('/api/quizzes/1000000/results.csv').status_code, 404)
+
+
+class AsyncViewParityTests(TestCase):
+    # The async endpoints return what their DRF counterparts return for the same query
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.others = [User.objects.create_user(username=f'user{i}', password='secret') for i in range(3)]
+        for other in self.others:
+            chat_room, _ = get_or_create_direct_room(self.user, other)
+            message = Message.objects.create(chat_room=chat_room, sender=other, content=f'Hi from {other.username}')
+            record_message(message)
+        self.quizzes = [Quiz.objects.create(provider=self.others[0], title=f'Quiz {i}', question='?') for i in range(3)]
+        UserQuiz.objects.create(user=self.user, quiz=self.quizzes[0], answer='42', status='already_taken', score=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def assert_same(self, path, query):
+        expected = await sync_to_async(self.client.get)(f'/api/{path}', query)
+        response = await self.async_client.get(f'/api/async/{path}', query, headers=self.headers)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), json.loads(expected.content))
+        return response
+
+    async def test_inbox(self):
+        await self.assert_same('my-chat-rooms/', {})
+        response = await self.assert_same('my-chat-rooms/', {'limit': 2})
+        await self.assert_same('my-chat-rooms/', {'limit': 2, 'cursor': response.json()['next']})
+        await self.assert_same('my-chat-rooms/', {'cursor': 'not-a-cursor'})
+
+    async def test_quiz_list(self):
+        await self.assert_same('quizzes/', {})
+        response = await self.assert_same('quizzes/', {'limit': 2, 'fields': 'id,title'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        await self.assert_same('quizzes/', {'limit': 2, 'cursor': response.json()['next']})
+        response = await self.assert_same('quizzes/', {'include_status': 'true'})
+        self.assertEqual([quiz['user_status']['status'] for quiz in response.json()], ['already_taken', 'not_taken', 'not_taken'])
+        await self.assert_same('quizzes/', {'limit': 'many'})
+
+    async def test_quiz_list_is_cached_and_conditional(self):
+        response = await self.async_client.get('/api/async/quizzes/')
+        etag = response['ETag']
+        response = await self.async_client.get('/api/async/quizzes/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        await Quiz.objects.filter(id=self.quizzes[0].id).aupdate(title='Changed', updated_at=timezone.now())
+        response = await self.async_client.get('/api/async/quizzes/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Changed', [quiz['title'] for quiz in response.json()])
+
+
+class BareProcessExecutor(ProcessExecutor):
+    # Workers without the model and index, for tasks that need neither
+    def _create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method))
+
+
+class ChatbotExecutorTests(TestCase):
+    def make_executor(self):
+        executor = BareProcessExecutor(workers=1, max_pending=2, timeout=10, start_method='fork')
+        self.addCleanup(executor.shutdown)
+        return executor
+
+    def test_dead_worker_fails_the_task_and_replaces_the_pool(self):
+        executor = self.make_executor()
+        with self.assertRaises(ExecutorFailed):
+            executor.run(os._exit, 1)
+        self.assertEqual(executor.run(abs, -3), 3)
+
+    async def test_dead_worker_fails_the_async_task(self):
+        executor = self.make_executor()
+        with self.assertRaises(ExecutorFailed):
+            await executor.arun(os._exit, 1)
+        self.assertEqual(await executor.arun(abs, -3), 3)
+
+    def test_full_queue_and_timeout(self):
+        executor = self.make_executor()
+        with self.assertRaises(ExecutorTimeout):
+            executor.run(time.sleep, 2, timeout=0.2)
+        executor = BareProcessExecutor(workers=1, max_pending=1, timeout=10, start_method='fork')
+        self.addCleanup(executor.shutdown)
+        executor.submit(time.sleep, 1)
+        with self.assertRaises(ExecutorBusy):
+            executor.submit(abs, -1)
+
+    def test_views_map_executor_errors(self):
+        client = APIClient()
+        client.force_authenticate(User(username='alice'))
+        for error, status_code in ((ExecutorBusy, 429), (ExecutorTimeout, 503), (ExecutorFailed, 503)):
+            with mock.patch('api.views.get_executor') as get_executor:
+                get_executor.return_value.run.side_effect = error()
+                response = client.post('/api/chatbot/', {'question': 'What is APR?'}, format='json')
+            self.assertEqual(response.status_code, status_code)
+            if status_code == 429:
+                self.assertIn('Retry-After', response)
+
+    def test_cache_stats_are_off_with_worker_processes(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='admin', password='secret', is_staff=True))
+        self.assertEqual(client.get('/api/chatbot/cache-stats/').status_code, 200)
+        with self.settings(CHATBOT_EXECUTOR='process'):
+            self.assertEqual(client.get('/api/chatbot/cache-stats/').status_code, 404)
+
+
+class StubEncoder:
+    """Stands in for the SentenceTransformer: a hashed bag of words, so texts sharing words are similar."""
+    dim = 64
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True):
+        texts = list(texts)
+        self.calls.append(texts)
+        rows = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(rows, texts):
+            for token in tokenize(text):
+                row[zlib.crc32(token.encode('utf-8')) % (self.dim - 1)] += 1
+            # Keeps stopword-only texts off the zero vector
+            row[-1] = 0.01
+        return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+    @property
+    def encoded(self):
+        return [text for call in self.calls for text in call]
+
+
+def write_docx(path, paragraphs):
+    # '# ' marks a heading
+    document = Document()
+    for text in paragraphs:
+        if text.startswith('# '):
+            document.add_heading(text[2:], level=1)
+        else:
+            document.add_paragraph(text)
+    document.save(path)
+    return str(path)
+
+
+BUDGET_DOC = [
+    '# Budgeting',
+    'A budget lists your monthly income and expenses.',
+    'Track every expense for a month before you set spending limits.',
+    '# Emergency fund',
+    'An emergency fund covers three to six months of essential expenses.',
+]
+CREDIT_DOC = [
+    '# Credit cards',
+    'Credit card interest is charged on the balance you carry past the due date.',
+    'The APR is the yearly interest rate of the card.',
+]
+
+
+class KnowledgeBaseTestCase(SimpleTestCase):
+    """A temporary knowledge directory and index, the stub encoder, and fresh chatbot module state."""
+
+    def setUp(self):
+        self.index_dir = Path(tempfile.mkdtemp())
+        self.docs_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.docs_dir, ignore_errors=True)
+        overrides = self.settings(
+            CHATBOT_MODEL_NAME='stub', CHATBOT_ENCODER_BACKEND='torch',
+            CHATBOT_INDEX_DIR=self.index_dir, CHATBOT_KNOWLEDGE_FILES=[], CHATBOT_KNOWLEDGE_DIRS=[self.docs_dir],
+            CHATBOT_CHUNK_TOKENS=20, CHATBOT_CHUNK_OVERLAP=5, CHATBOT_WATCH_INTERVAL=0,
+            CHATBOT_MICRO_BATCHING=False, CHATBOT_CACHE_BACKEND=None,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.encoder = StubEncoder()
+        encoder_module._models[('stub', 'torch')] = self.encoder
+        self.addCleanup(encoder_module._models.pop, ('stub', 'torch'), None)
+        self.reset_index()
+        self.addCleanup(self.reset_index)
+
+    def reset_index(self):
+        if index_module._rebuild_thread is not None:
+            index_module._rebuild_thread.join(10)
+        index_module._index = None
+        index_module._watcher = None
+
+    def write(self, name, paragraphs):
+        return write_docx(self.docs_dir / name, paragraphs)
+
+
+class PersistedIndexTests(KnowledgeBaseTestCase):
+    def test_index_is_built_once_and_reused_from_disk(self):
+        self.write('budget.docx', BUDGET_DOC)
+        index = load_or_build_index()
+        self.assertEqual(len(index), 2)
+        self.assertEqual(len(self.encoder.encoded), 2)
+
+        reloaded = load_or_build_index()
+        self.assertEqual(len(self.encoder.encoded), 2)
+        self.assertEqual(reloaded.key, index.key)
+        self.assertIsInstance(reloaded.embeddings, np.memmap)
+        np.testing.assert_array_equal(reloaded.embeddings, index.embeddings)
+
+    def test_settings_change_rebuilds(self):
+        self.write('budget.docx', BUDGET_DOC)
+        index = load_or_build_index()
+        with self.settings(CHATBOT_CHUNK_TOKENS=8):
+            self.assertIsNone(load_index(index.key))
+            rebuilt = load_or_build_index()
+        self.assertNotEqual(rebuilt.key, index.key)
+        self.assertGreater(len(rebuilt), len(index))
+
+    def test_answers_come_from_the_index(self):
+        self.write('budget.docx', BUDGET_DOC)
+        hits = answer_questions(['How many months should an emergency fund cover?'])[0]
+        self.assertEqual(hits[0]['heading'], 'Emergency fund')
+        self.assertEqual(hits[0]['source'], 'budget.docx')
+
+
+class FileWatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = self.dir / 'knowledge.docx'
+        self.path.write_bytes(b'first')
+        self.changes = []
+
+    def watcher(self, paths, interval=0):
+        watcher = FileWatcher(paths, on_change=lambda: self.changes.append(True), interval=interval)
+        watcher.prime()
+        return watcher
+
+    def test_content_change_is_detected(self):
+        watcher = self.watcher([str(self.path)])
+        self.assertFalse(watcher.check())
+        self.path.write_bytes(b'second version')
+        self.assertTrue(watcher.check())
+        self.assertEqual(self.changes, [True])
+        self.assertFalse(watcher.check())
+
+    def test_touch_without_content_change_is_ignored(self):
+        watcher = self.watcher([str(self.path)])
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertFalse(watcher.check())
+        self.assertEqual(self.changes, [])
+
+    def test_added_and_removed_files_are_detected(self):
+        watcher = self.watcher(lambda: sorted(str(path) for path in self.dir.iterdir()))
+        (self.dir / 'extra.pdf').write_bytes(b'pdf')
+        self.assertTrue(watcher.check())
+        self.path.unlink()
+        self.assertTrue(watcher.check())
+        self.assertEqual(len(self.changes), 2)
+
+    def test_checks_at_most_once_per_interval(self):
+        watcher = self.watcher([str(self.path)], interval=60)
+        self.path.write_bytes(b'second version')
+        self.assertFalse(watcher.check())
+        self.assertEqual(self.changes, [])
+
+
+class IndexRebuildTests(KnowledgeBaseTestCase):
+    def test_changed_documents_are_swapped_in_by_a_background_rebuild(self):
+        self.write('budget.docx', BUDGET_DOC)
+        index = get_index()
+        self.write('credit.docx', CREDIT_DOC)
+        release = threading.Event()
+
+        def slow_build(*args, **kwargs):
+            release.wait(10)
+            return load_or_build_index(*args, **kwargs)
+
+        with mock.patch.object(index_module, 'load_or_build_index', slow_build):
+            # The request that notices the change is served from the index it already has
+            self.assertIs(get_index(), index)
+            rebuild = index_module._rebuild_thread
+            release.set()
+            rebuild.join(10)
+        rebuilt = get_index()
+        self.assertNotEqual(rebuilt.version, index.version)
+        self.assertEqual({chunk['source'] for chunk in rebuilt.chunks}, {'budget.docx', 'credit.docx'})
+
+
+class EncoderLoadingTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(encoder_module._models.pop, ('model', 'fake'), None)
+
+    def test_concurrent_callers_share_one_load(self):
+        loads = []
+
+        def load(name):
+            loads.append(name)
+            time.sleep(0.05)
+            return StubEncoder()
+
+        models = []
+        with mock.patch.dict(LOADERS, {'fake': load}):
+            threads = [
+                threading.Thread(target=lambda: models.append(get_model('model', 'fake'))) for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(loads, ['model'])
+        self.assertEqual(len({id(model) for model in models}), 1)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_model('model', 'missing')
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.encoder = StubEncoder()
+
+    def test_full_batch_flushes_before_the_window(self):
+        batcher = MicroBatcher(self.encoder.encode, window_ms=10000, max_batch=3)
+        started = time.monotonic()
+        embeddings = batcher.encode(['budget', 'credit', 'savings'], timeout=5)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(embeddings.shape, (3, StubEncoder.dim))
+        self.assertEqual(self.encoder.calls, [['budget', 'credit', 'savings']])
+
+    def test_window_flushes_a_partial_batch(self):
+        batcher = MicroBatcher(self.encoder.encode, window_ms=20, max_batch=32)
+        embeddings = batcher.encode(['budget'], timeout=5)
+        np.testing.assert_allclose(embeddings[0], self.encoder.encode(['budget'])[0])
+
+    def test_concurrent_requests_share_one_forward_pass(self):
+        batcher = MicroBatcher(self.encoder.encode, window_ms=500, max_batch=4)
+        results = {}
+
+        def ask(question):
+            results[question] = batcher.encode([question], timeout=5)[0]
+
+        threads = [threading.Thread(target=ask, args=(question,)) for question in ('a', 'b', 'c', 'd')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.encoder.calls), 1)
+        self.assertEqual(sorted(self.encoder.calls[0]), ['a', 'b', 'c', 'd'])
+        # Each caller gets the row of its own question
+        for question, embedding in results.items():
+            np.testing.assert_allclose(embedding, self.encoder.encode([question])[0])
+
+    def test_errors_reach_every_caller(self):
+        def fail(texts):
+            raise RuntimeError('encoder failed')
+
+        batcher = MicroBatcher(fail, window_ms=20, max_batch=32)
+        futures = [batcher.submit(text) for text in ('a', 'b')]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+
+class ChatbotBatchEndpointTests(KnowledgeBaseTestCase):
+    def test_batch_is_answered_with_one_encoder_pass(self):
+        self.write('budget.docx', BUDGET_DOC)
+        get_index()
+        self.encoder.calls.clear()
+        client = APIClient()
+        client.force_authenticate(User(username='alice'))
+        questions = ['What is a budget?', 'How big is an emergency fund?']
+        response = client.post('/api/chatbot/batch/', {'questions': questions, 'k': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([answer['question'] for answer in response.data['answers']], questions)
+        self.assertEqual(response.data['answers'][1]['matches'][0]['heading'], 'Emergency fund')
+        self.assertEqual(self.encoder.calls, [questions])
+
+    def test_question_limit(self):
+        client = APIClient()
+        client.force_authenticate(User(username='alice'))
+        with self.settings(CHATBOT_BATCH_MAX_QUESTIONS=2):
+            response = client.post('/api/chatbot/batch/', {'questions': ['a', 'b', 'c']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class QuestionCacheTests(SimpleTestCase):
+    def test_lru_eviction(self):
+        lru = LocalLRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIs(lru.get('b'), cache_module._MISSING)
+        self.assertEqual(len(lru), 2)
+
+    def test_ttl_expiry(self):
+        lru = LocalLRUCache(maxsize=2, ttl=60)
+        with mock.patch('api.chatbot.cache.time.monotonic', return_value=1000.0):
+            lru.set('a', 1)
+        with mock.patch('api.chatbot.cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(lru.get('a'), 1)
+        with mock.patch('api.chatbot.cache.time.monotonic', return_value=1061.0):
+            self.assertIs(lru.get('a'), cache_module._MISSING)
+
+    def test_normalised_questions_share_an_entry(self):
+        question_cache = QuestionCache(LocalLRUCache(maxsize=10, ttl=60))
+        question_cache.use_version('v1')
+        question_cache.set_answer('What is  APR?', ['hit'], 1)
+        self.assertEqual(question_cache.get_answer('what is apr', 1), (True, ['hit']))
+        self.assertEqual(question_cache.get_answer('what is apr', 3), (False, None))
+        self.assertEqual(question_cache.stats()['hits']['answer'], 1)
+        self.assertEqual(question_cache.stats()['misses']['answer'], 1)
+
+    def test_version_change_drops_entries(self):
+        question_cache = QuestionCache(LocalLRUCache(maxsize=10, ttl=60))
+        question_cache.use_version('v1')
+        question_cache.set_embedding('What is APR?', np.ones(2))
+        question_cache.set_answer('What is APR?', None, 1)
+        self.assertEqual(question_cache.get_answer('What is APR?', 1), (True, None))
+        question_cache.use_version('v2')
+        self.assertIsNone(question_cache.get_embedding('What is APR?'))
+        self.assertEqual(question_cache.get_answer('What is APR?', 1), (False, None))
+
+
+class CachedAnswerTests(KnowledgeBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = self.settings(CHATBOT_CACHE_BACKEND='local')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        cache_module._cache = None
+        self.addCleanup(setattr, cache_module, '_cache', None)
+
+    def test_repeated_questions_skip_the_encoder(self):
+        self.write('budget.docx', BUDGET_DOC)
+        first = answer_questions(['What is a budget?'])
+        encoded = len(self.encoder.encoded)
+        self.assertEqual(answer_questions(['what is a BUDGET']), first)
+        self.assertEqual(len(self.encoder.encoded), encoded)
+
+    def test_answers_do_not_outlive_the_index(self):
+        self.write('budget.docx', BUDGET_DOC)
+        question = 'What is the APR of a credit card?'
+        self.assertNotEqual([hit['heading'] for hit in answer_questions([question])[0]], ['Credit cards'])
+        self.write('credit.docx', CREDIT_DOC)
+        set_index(load_or_build_index())
+        self.assertEqual([hit['heading'] for hit in answer_questions([question])[0]], ['Credit cards'])
+
+
+class ChunkerTests(SimpleTestCase):
+    def paragraphs(self):
+        texts = [f'Paragraph {i} has exactly six words.' for i in range(10)]
+        return [Paragraph(0, 'Saving', True)] + [Paragraph(i + 1, text, False) for i, text in enumerate(texts)]
+
+    def body(self, chunk):
+        # The chunk text without its heading line
+        return chunk['text'].split('\n', 1)[1] if chunk['heading'] else chunk['text']
+
+    def test_chunks_respect_the_budget_and_overlap(self):
+        chunks = list(chunk_paragraphs(self.paragraphs(), max_tokens=20, overlap=6))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(self.body(chunk)), 20)
+            self.assertTrue(chunk['text'].startswith('Saving\n'))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            # One six-word paragraph fits the overlap and is repeated at the start of the next chunk
+            self.assertEqual(self.body(chunk).split('\n')[0], self.body(previous).split('\n')[-1])
+            self.assertEqual(chunk['start'], previous['end'] - 1)
+        covered = {line for chunk in chunks for line in self.body(chunk).split('\n')}
+        self.assertEqual(covered, {paragraph.text for paragraph in self.paragraphs()[1:]})
+
+    def test_no_overlap_across_headings(self):
+        paragraphs = [
+            Paragraph(0, 'Saving', True), Paragraph(1, 'Save a little every month.', False),
+            Paragraph(2, 'Debt', True), Paragraph(3, 'Pay the most expensive debt first.', False),
+        ]
+        chunks = list(chunk_paragraphs(paragraphs, max_tokens=20, overlap=10))
+        self.assertEqual([chunk['text'] for chunk in chunks], [
+            'Saving\nSave a little every month.', 'Debt\nPay the most expensive debt first.',
+        ])
+        self.assertEqual([(chunk['start'], chunk['end']) for chunk in chunks], [(1, 2), (3, 4)])
+
+    def test_long_paragraphs_are_split_on_sentences_then_words(self):
+        sentences = ['One two three four five six.', 'Seven eight nine ten.', ' '.join(['word'] * 12) + '.']
+        chunks = list(chunk_paragraphs([Paragraph(0, ' '.join(sentences), False)], max_tokens=8, overlap=0))
+        self.assertEqual([chunk['text'] for chunk in chunks], [
+            sentences[0], sentences[1], ' '.join(['word'] * 8), ' '.join(['word'] * 3) + ' word.',
+        ])
+        self.assertTrue(all(chunk['heading'] is None for chunk in chunks))
+
+
+def clustered_embeddings(rows, seed=0, clusters=20, dim=16):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = centers[rng.integers(clusters, size=rows)] + 0.2 * rng.normal(size=(rows, dim))
+    return (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+
+
+class RetrievalTests(SimpleTestCase):
+    def test_ivf_probing_every_list_is_exact(self):
+        embeddings = clustered_embeddings(500)
+        queries = clustered_embeddings(20, seed=1)
+        ivf = IVFSearch(embeddings, nlist=10, nprobe=10)
+        exact_scores, exact_ids = ExactSearch(embeddings).search(queries, 5)
+        ivf_scores, ivf_ids = ivf.search(queries, 5)
+        np.testing.assert_array_equal(ivf_ids, exact_ids)
+        np.testing.assert_allclose(ivf_scores, exact_scores, rtol=1e-5)
+
+    def test_ivf_recall_against_exact_search(self):
+        embeddings = clustered_embeddings(3000)
+        queries = clustered_embeddings(50, seed=1)
+        _, exact_ids = ExactSearch(embeddings).search(queries, 10)
+        _, ivf_ids = IVFSearch(embeddings, nprobe=8).search(queries, 10)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(exact_ids, ivf_ids)])
+        self.assertGreaterEqual(recall, 0.9)
+
+    def test_exact_search_below_the_ann_threshold(self):
+        embeddings = clustered_embeddings(50)
+        with self.settings(CHATBOT_ANN_BACKEND='ivf', CHATBOT_ANN_MIN_CHUNKS=100):
+            self.assertIsInstance(build_searcher(embeddings), ExactSearch)
+        with self.settings(CHATBOT_ANN_BACKEND='ivf', CHATBOT_ANN_MIN_CHUNKS=10):
+            self.assertIsInstance(build_searcher(embeddings), IVFSearch)
+
+    def test_top_k_and_min_score(self):
+        embeddings = np.array([[0.05, 1.0], [0.9, 0.44], [0.5, 0.87]], dtype=np.float32)
+        chunks = [{'text': text} for text in ('low', 'best', 'middle')]
+        index = KnowledgeIndex('0' * 64, chunks, embeddings)
+        query = np.array([[1.0, 0.0]], dtype=np.float32)
+        self.assertEqual([hit['text'] for hit in index.search(query, k=2)[0]], ['best', 'middle'])
+        self.assertEqual([hit['text'] for hit in index.search(query, k=5)[0]], ['best', 'middle'])
+        self.assertEqual([hit['text'] for hit in index.search(query, k=5, min_score=0.6)[0]], ['best'])
+        self.assertAlmostEqual(index.search(query, k=1)[0][0]['score'], 0.9, places=5)
+
+
+class ChatbotEndpointTests(KnowledgeBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User(username='alice'))
+
+    def test_top_k_matches_with_scores(self):
+        self.write('budget.docx', BUDGET_DOC + CREDIT_DOC)
+        response = self.client.post(
+            '/api/chatbot/', {'question': 'How much interest does a credit card charge?', 'k': 3, 'min_score': 0}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        matches = response.data['matches']
+        self.assertEqual(response.data['answer'], matches[0]['text'])
+        self.assertEqual(matches[0]['heading'], 'Credit cards')
+        self.assertEqual([match['score'] for match in matches], sorted((match['score'] for match in matches), reverse=True))
+        self.assertTrue({'source', 'start', 'end'} <= set(matches[0]))
+
+    def test_k_is_capped(self):
+        with self.settings(CHATBOT_MAX_K=3):
+            response = self.client.post('/api/chatbot/', {'question': 'What is APR?', 'k': 4}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class IngestionTests(KnowledgeBaseTestCase):
+    def segments(self):
+        return sorted(path.stem for path in (self.index_dir / 'documents').glob('*.json'))
+
+    def test_only_changed_documents_are_reencoded(self):
+        self.write('budget.docx', BUDGET_DOC)
+        self.write('credit.docx', CREDIT_DOC)
+        load_or_build_index()
+        self.encoder.calls.clear()
+
+        self.write('credit.docx', CREDIT_DOC + ['Pay the full balance to avoid interest.'])
+        index = load_or_build_index()
+        self.assertTrue(self.encoder.encoded)
+        self.assertTrue(all(text.startswith('Credit cards\n') for text in self.encoder.encoded))
+        self.assertEqual({chunk['source'] for chunk in index.chunks}, {'budget.docx', 'credit.docx'})
+        self.assertEqual(len(index.embeddings), len(index.chunks))
+        # The segment of the old credit.docx is pruned
+        self.assertEqual(len(self.segments()), 2)
+
+    def test_removed_documents_are_dropped(self):
+        self.write('budget.docx', BUDGET_DOC)
+        credit = self.write('credit.docx', CREDIT_DOC)
+        load_or_build_index()
+        os.unlink(credit)
+        index = load_or_build_index()
+        self.assertEqual({chunk['source'] for chunk in index.chunks}, {'budget.docx'})
+        self.assertEqual(self.segments(), [hash_file(str(self.docs_dir / 'budget.docx'))])
+
+    def test_force_reencodes_everything(self):
+        self.write('budget.docx', BUDGET_DOC)
+        load_or_build_index()
+        self.encoder.calls.clear()
+        index = load_or_build_index(force=True)
+        self.assertEqual(len(self.encoder.encoded), len(index))
+
+    def test_pdf_pages_are_indexed(self):
+        import fitz  # PyMuPDF
+
+        with fitz.open() as pdf:
+            for text in ('An index fund tracks a market index.', 'Diversification spreads investment risk.'):
+                pdf.new_page().insert_text((72, 72), text)
+            pdf.save(str(self.docs_dir / 'investing.pdf'))
+        index = load_or_build_index()
+        self.assertEqual([(chunk['source'], chunk['page']) for chunk in index.chunks], [('investing.pdf', 1)])
+        self.assertIn('Diversification spreads investment risk.', index.chunks[0]['text'])
+
+
+class LexicalSearchTests(SimpleTestCase):
+    texts = ['APR interest rate of a card', 'budget spending plan', 'savings account interest']
+    # Unit vectors; the question embedding below is closest to the budget chunk, which shares no term with it
+    embeddings = np.array([[0.6, 0.8, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]], dtype=np.float32)
+    question = 'What is the APR interest?'
+    question_embedding = np.array([[0.0, 1.0, 0.0]], dtype=np.float32)
+
+    def index(self):
+        return KnowledgeIndex('0' * 64, [{'text': text} for text in self.texts], self.embeddings)
+
+    def test_bm25_scores(self):
+        bm25 = BM25Index(self.texts)
+        ids, scores = bm25.score(self.question)
+        scores = dict(zip(ids.tolist(), scores.tolist()))
+        self.assertEqual(set(scores), {0, 2})
+        # Okapi BM25 with k1=1.5, b=0.75, worked out by hand for the first chunk (4 terms without stopwords)
+        average_length = (4 + 3 + 3) / 3
+        norm = 1.5 * (1 - 0.75 + 0.75 * 4 / average_length)
+        expected = sum(math.log(1 + (3 - n + 0.5) / (n + 0.5)) * 2.5 / (1 + norm) for n in (1, 2))
+        self.assertAlmostEqual(scores[0], expected, places=5)
+        # The rare term outweighs the common one
+        self.assertGreater(scores[0], scores[2])
+        self.assertEqual(bm25.search('what is it', 5)[1].tolist(), [])
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([np.array([1, 0]), np.array([0, 2])])
+        self.assertEqual(sorted(fused, key=fused.get, reverse=True), [0, 1, 2])
+        self.assertAlmostEqual(fused[0], 1 / 62 + 1 / 61)
+
+    def test_lexical_mode(self):
+        hits = self.index().search_lexical([self.question], k=5, min_score=0)[0]
+        self.assertEqual([hit['text'] for hit in hits], [self.texts[0], self.texts[2]])
+
+    def test_hybrid_with_prefilter_scores_only_lexical_candidates(self):
+        hits = self.index().search_hybrid([self.question], self.question_embedding, k=3, min_score=0, prefilter=True)[0]
+        self.assertEqual([hit['text'] for hit in hits], [self.texts[0], self.texts[2]])
+        # score stays the cosine similarity
+        self.assertAlmostEqual(hits[0]['score'], 0.8, places=5)
+        self.assertGreater(hits[0]['lexical_score'], 0)
+
+    def test_hybrid_without_prefilter_fuses_both_rankings(self):
+        hits = self.index().search_hybrid([self.question], self.question_embedding, k=3, min_score=0, prefilter=False)[0]
+        # Chunks found by both rankings come first, then the dense-only budget chunk
+        self.assertEqual([hit['text'] for hit in hits], [self.texts[0], self.texts[2], self.texts[1]])
+        self.assertEqual(hits[2]['lexical_score'], 0)
+        # min_score applies to the cosine similarity
+        hits = self.index().search_hybrid([self.question], self.question_embedding, k=3, min_score=0.5, prefilter=False)[0]
+        self.assertEqual([hit['text'] for hit in hits], [self.texts[0], self.texts[1]])
+
+    def test_hybrid_falls_back_to_dense_without_shared_terms(self):
+        hits = self.index().search_hybrid(['Tell me more'], self.question_embedding, k=1, min_score=0, prefilter=True)[0]
+        self.assertEqual([hit['text'] for hit in hits], [self.texts[1]])
+
+
+class LexicalModeTests(KnowledgeBaseTestCase):
+    def test_lexical_mode_skips_the_encoder(self):
+        self.write('credit.docx', CREDIT_DOC)
+        get_index()
+        self.encoder.calls.clear()
+        hits = answer_questions(['What is the APR?'], k=1, min_score=0, mode='lexical')[0]
+        self.assertEqual(hits[0]['heading'], 'Credit cards')
+        self.assertEqual(self.encoder.calls, [])
+
+
+class OnnxEncoderTests(SimpleTestCase):
+    def encoder(self):
+        def tokenizer(texts, **kwargs):
+            # One token per word, padded to the longest text of the batch
+            length = max(len(text.split()) for text in texts)
+            mask = np.array([[1] * len(text.split()) + [0] * (length - len(text.split())) for text in texts])
+            return {'input_ids': mask.copy(), 'attention_mask': mask, 'token_type_ids': np.zeros_like(mask)}
+
+        class Session:
+            def __init__(self):
+                self.feeds = []
+
+            def run(self, outputs, feeds):
+                self.feeds.append(feeds)
+                batch, length = feeds['input_ids'].shape
+                # Token t has embedding (t + 1, 1); padding rows would skew the mean if counted
+                tokens = np.stack([np.arange(1, length + 1), np.ones(length)], axis=1).astype(np.float32)
+                return [np.repeat(tokens[None], batch, axis=0)]
+
+        encoder = OnnxEncoder.__new__(OnnxEncoder)
+        encoder.config = {'max_seq_length': 128}
+        encoder.tokenizer = tokenizer
+        encoder.session = Session()
+        encoder.input_names = {'input_ids', 'attention_mask'}
+        return encoder
+
+    def test_mean_pooling_ignores_padding(self):
+        encoder = self.encoder()
+        embeddings = encoder.encode(['one', 'one two three'], normalize_embeddings=False)
+        np.testing.assert_allclose(embeddings, [[1, 1], [2, 1]])
+        # Only inputs the exported graph declares are fed
+        self.assertEqual(set(encoder.session.feeds[0]), {'input_ids', 'attention_mask'})
+
+    def test_normalised_and_batched(self):
+        encoder = self.encoder()
+        embeddings = encoder.encode(['one', 'one two three', 'one two'], batch_size=2)
+        self.assertEqual(len(encoder.session.feeds), 2)
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, rtol=1e-6)
+        np.testing.assert_allclose(embeddings[1], np.array([2, 1]) / np.sqrt(5), rtol=1e-6)
+
+    def test_stale_exports_are_redone(self):
+        index_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, index_dir, ignore_errors=True)
+        export_dir = index_dir / 'onnx' / 'org__model'
+        export_dir.mkdir(parents=True)
+        (export_dir / 'encoder.json').write_text(json.dumps({'model': 'org/model', 'version': ONNX_EXPORT_VERSION - 1}))
+        with self.settings(CHATBOT_INDEX_DIR=index_dir), \
+                mock.patch('api.chatbot.backends.export_onnx') as export, \
+                mock.patch('api.chatbot.backends.OnnxEncoder') as onnx_encoder:
+            load_onnx('org/model', threads=2)
+            export.assert_called_once_with('org/model', export_dir)
+            onnx_encoder.assert_called_once_with(export_dir, 2)
+            (export_dir / 'encoder.json').write_text(json.dumps({'model': 'org/model', 'version': ONNX_EXPORT_VERSION}))
+            load_onnx('org/model')
+            export.assert_called_once()
+
+
+class WebSocketTests(TestCase):
+    application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.other = User.objects.create_user(username='bob', password='secret')
+        self.outsider = User.objects.create_user(username='eve', password='secret')
+        self.chat_room, _ = get_or_create_direct_room(self.user, self.other)
+
+    def communicator(self, path, user=None, token=None):
+        if user is not None:
+            token = AccessToken.for_user(user)
+        return WebsocketCommunicator(self.application, f'{path}?token={token}' if token else path)
+
+    def send(self, content):
+        client = APIClient()
+        client.force_authenticate(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'/api/create-chat/{self.user.id}/', {'content': content}, format='json')
+
+    async def test_member_receives_room_messages(self):
+        room = self.communicator(f'/ws/chat_rooms/{self.chat_room.id}/', self.user)
+        connected, _ = await room.connect()
+        self.assertTrue(connected)
+        await sync_to_async(self.send)('hello')
+        event = await room.receive_json_from(timeout=5)
+        self.assertEqual((event['type'], event['message']['content']), ('message', 'hello'))
+        await room.disconnect()
+
+    async def test_inbox_receives_deltas(self):
+        inbox = self.communicator('/ws/inbox/', self.user)
+        connected, _ = await inbox.connect()
+        self.assertTrue(connected)
+        await sync_to_async(self.send)('hello')
+        event = await inbox.receive_json_from(timeout=5)
+        self.assertEqual(
+            (event['type'], event['room']['id'], event['room']['latest_message']), ('inbox', self.chat_room.id, 'hello'),
+        )
+        await inbox.disconnect()
+
+    async def test_non_members_are_rejected(self):
+        room = self.communicator(f'/ws/chat_rooms/{self.chat_room.id}/', self.outsider)
+        self.assertEqual(await room.connect(), (False, 4403))
+
+    async def test_missing_or_bad_tokens_are_anonymous(self):
+        # A refresh token is signed but is not an access token
+        for token in (None, 'not-a-jwt', RefreshToken.for_user(self.user)):
+            inbox = self.communicator('/ws/inbox/', token=token)
+            self.assertEqual(await inbox.connect(), (False, 4401))
+            room = self.communicator(f'/ws/chat_rooms/{self.chat_room.id}/', token=token)
+            self.assertEqual(await room.connect(), (False, 4403))
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from . import views
+from . import async_views, views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.routers import DefaultRouter
 from .views import ChatbotViewSet
@@ -25,6 +25,7 @@ urlpatterns = [
     
     
     path('create-chat/<int:receiver_id>/', views.create_chat_room_and_send_message, name='create-chat'),
+    path('send-bulk-message/', views.send_bulk_message, name='send-bulk-message'),
     path('my-chat-rooms/', views.get_chat_rooms_for_logged_in_user, name='my-chat-rooms'),
     path('chat_rooms/<int:other_user_id>/<int:current_user_id>/', views.ChatRoomView.as_view(), name='chat-room-list'),
     
@@ -35,11 +36,21 @@ urlpatterns = [
     path('quiz/<int:id>/', views.QuizDetailView.as_view(), name='quiz-detail'),
     path('submit-answer/<int:quiz_id>/', views.SubmitQuizAnswerView.as_view(), name='submit-quiz-answer'),
     path('check-quiz-status/<int:quiz_id>/', views.CheckQuizStatusView.as_view(), name='check-quiz-status'),
+    path('quiz-statuses/', views.QuizStatusListView.as_view(), name='quiz-statuses'),
     
     path('quizzes/provider/<int:provider_id>/', views.QuizByProviderView.as_view(), name='quizzes-by-provider'),
     path('quizzes/<int:quiz_id>/users/', views.UserQuizListView.as_view(), name='user-quiz-list'),
+    path('quizzes/<int:quiz_id>/results.csv', views.QuizResultsExportView.as_view(), {'export_format': 'csv'}, name='quiz-results-csv'),
+    path('quizzes/<int:quiz_id>/results.jsonl', views.QuizResultsExportView.as_view(), {'export_format': 'jsonl'}, name='quiz-results-jsonl'),
     
     path('userquiz/<int:pk>/update/', views.UserQuizUpdateView.as_view(), name='userquiz-update'),
+    path('userquiz/bulk-update/', views.BulkGradeView.as_view(), name='userquiz-bulk-update'),
+    
+    path('async/chatbot/', async_views.chatbot, name='async-chatbot'),
+    path('async/my-chat-rooms/', async_views.my_chat_rooms, name='async-my-chat-rooms'),
+    path('async/chat_rooms/<int:other_user_id>/<int:current_user_id>/', async_views.chat_room_messages, name='async-chat-room-list'),
+    path('async/chat_rooms/<int:chat_room_id>/wait/', async_views.wait_for_messages, name='async-chat-room-wait'),
+    path('async/quizzes/', async_views.quiz_list, name='async-quiz-list'),
     
     path('', include(api_router.urls)),
 ]
\ No newline at end of file
@@ -1,127 +1,110 @@
 # views.py
 from rest_framework import generics, permissions, views
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.contrib.auth.models import User
 from rest_framework import status, viewsets
-from .serializers import UserSerializer, UserProfileSerializer, MessageSerializer, ChatRoomSerializer, ChatbotSerializer, QuizSerializer, UserQuizDetailSerializer, UserQuizSerializer
+from .serializers import BulkGradeSerializer, BulkMessageSerializer, QuizSubmissionSerializer, UserSerializer, UserProfileSerializer, MessageSerializer, ChatRoomSerializer, ChatbotSerializer, ChatbotBatchSerializer, QuizSerializer, QuizStatusQuerySerializer, UserQuizDetailSerializer, UserQuizSerializer
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.http import FileResponse, Http404, JsonResponse
-from django.shortcuts import get_object_or_404
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views import View
-from rest_framework.decorators import api_view, permission_classes
-from .models import UserProfile, Message, ChatRoom, Quiz, UserQuiz
-from django.db.models import Q, Max
+from rest_framework.decorators import action, api_view, permission_classes
+from .models import UserProfile, Message, Quiz, UserQuiz
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.contrib.auth import get_user_model
 from rest_framework.generics import RetrieveAPIView, UpdateAPIView
-import json
-from docx import Document
-from sentence_transformers import SentenceTransformer, util
 from django.views.decorators.csrf import csrf_exempt
+from .chatbot.cache import get_question_cache
+from .chatbot.conf import chatbot_setting
+from .chatbot.executor import ExecutorBusy, ExecutorFailed, ExecutorTimeout, get_executor
+from .chatbot.service import answer_questions
+from .catalogue import QuizCatalogueMixin
+from .chat_summaries import mark_read, record_message, record_messages
+from .exports import EXPORT_FORMATS, astream, quiz_result_rows
+from .history import message_history_page, message_history_query
+from .inbox import inbox_page, inbox_page_query, inbox_queryset
+from .quiz_status import user_quiz_statuses
+from .realtime import publish_message, publish_messages
+from .rooms import find_direct_room, get_or_create_direct_room, get_or_create_direct_rooms
+import logging
 UserModel = get_user_model()
 
-
-
-
-import logging
-import os
-from typing import List, Optional
-from rest_framework.response import Response
-import fitz  # PyMuPDF
-from sentence_transformers import SentenceTransformer, util
-from pathlib import Path
-from docx import Document
+# Members of a chat room with their profiles, as nested by ChatRoomSerializer
+ROOM_USERS = Prefetch('users', queryset=User.objects.select_related('profile_pic'))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# Define the relative path to the DOCX file
-def get_docx_path() -> str:
-    # Path to the DOCX file relative to this script
-    return str(Path(__file__).parent / 'knowledge.docx')
-
-def load_docx(file_path: str) -> str:
-    try:
-        full_path = file_path
-        if not os.path.exists(full_path):
-            logger.error(f"DOCX file does not exist at: {full_path}")
-            return ""
-        doc = Document(full_path)
-        text = "\n".join(paragraph.text for paragraph in doc.paragraphs)
-        logger.info("DOCX loaded successfully.")
-        return text
-    except Exception as e:
-        logger.error(f"Error loading DOCX: {e}")
-        return ""
-
-# Split the extracted text into chunks for easier searching
-def split_text_into_chunks(text: str, chunk_size: int = 800) -> List[str]:
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Encode the text chunks
-def encode_chunks(chunks: List[str]) -> List:
-    return model.encode(chunks, convert_to_tensor=True)
-
-# Find the best matching text chunk for a user question
-def find_best_match_in_docx(user_question: str, text_chunks: List[str], threshold: float = 0.1) -> Optional[str]:
-    user_question_embedding = model.encode(user_question, convert_to_tensor=True)
-    chunk_embeddings = encode_chunks(text_chunks)
-    similarities = util.pytorch_cos_sim(user_question_embedding, chunk_embeddings)
-    
-    logger.info(f"User question embedding: {user_question_embedding}")
-    logger.info(f"Chunk embeddings: {chunk_embeddings}")
-    logger.info(f"Similarities: {similarities}")
-
-    # Get the index of the most similar chunk
-    most_similar_idx = similarities.argmax()
-    logger.info(f"Most similar index: {most_similar_idx}")
-    logger.info(f"Highest similarity score: {similarities.max()}")
-
-    # Check if the highest similarity chunk is a single paragraph
-    answer = text_chunks[most_similar_idx] if similarities.max() > threshold else None
-
-    if answer and '\n' not in answer:
-        # Return the answer if it is a single paragraph
-        return answer
-
-    # Attempt to find a valid paragraph without new lines
-    for idx, chunk in enumerate(text_chunks):
-        if '\n' not in chunk and similarities[idx] > threshold:
-            return chunk  # Return the first valid paragraph found
-
-    return None  # No valid single paragraph found
-
 class ChatbotViewSet(viewsets.ViewSet):
     serializer_class = ChatbotSerializer
 
+    def _answer(self, hits):
+        return {
+            'answer': hits[0]['text'] if hits else "I don't understand the question.",
+            'matches': hits,
+        }
+
+    # Runs inference inline or in the worker pool; returns (results, None) or (None, error response)
+    def _run(self, questions, options):
+        try:
+            results = get_executor().run(answer_questions, questions, options['k'], options['min_score'], options['mode'])
+        except ExecutorBusy:
+            retry_after = chatbot_setting('CHATBOT_EXECUTOR_RETRY_AFTER')
+            return None, Response(
+                {'detail': 'The chatbot is busy, please try again shortly.'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(retry_after)},
+            )
+        except ExecutorTimeout:
+            return None, Response({'detail': 'The chatbot took too long to answer.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except ExecutorFailed:
+            return None, Response({'detail': 'The chatbot is restarting, please try again shortly.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return results, None
+
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
             user_question = serializer.validated_data['question']
-            
-            # Load and process the DOCX file
-            docx_path = get_docx_path()  # Get the relative path
-            docx_text = load_docx(docx_path)  # Use load_docx instead of load_pdf
-            if not docx_text:
-                return Response({'answer': "I don't understand the question."}, status=status.HTTP_200_OK)
-
-            text_chunks = split_text_into_chunks(docx_text)
-            logger.info(f"Text chunks: {text_chunks[:3]}")  # Log first few chunks for inspection
-
-            # Find the best match in the DOCX text
-            answer = find_best_match_in_docx(user_question, text_chunks)
-
-            if answer:
-                return Response({'answer': answer}, status=status.HTTP_200_OK)
-            else:
-                return Response({'answer': "I don't understand the question."}, status=status.HTTP_200_OK)
+
+            # Top-k matches in the knowledge base; the best one is the answer
+            results, error = self._run([user_question], serializer.validated_data)
+            if error is not None:
+                return error
+            return Response(self._answer(results[0]), status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        serializer = ChatbotBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        questions = serializer.validated_data['questions']
+        results, error = self._run(questions, serializer.validated_data)
+        if error is not None:
+            return error
+        return Response({
+            'answers': [dict(question=question, **self._answer(hits)) for question, hits in zip(questions, results)]
+        }, status=status.HTTP_200_OK)
+
+    # Hit/miss counters for sizing the question cache. With CHATBOT_EXECUTOR='process' the cache is
+    # used inside the pool workers and this process's counters stay at zero, so the endpoint is off
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request, *args, **kwargs):
+        if chatbot_setting('CHATBOT_EXECUTOR') == 'process':
+            return Response(
+                {'detail': 'Cache statistics are kept by the inference workers and are not available here.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        cache = get_question_cache()
+        if cache is None:
+            return Response({'detail': 'The chatbot cache is disabled.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(cache.stats(), status=status.HTTP_200_OK)
+
 
 
 
@@ -207,10 +190,10 @@ class AdvisorsListAPIView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return User.objects.filter(is_superuser=True).exclude(username='admin')
+        return User.objects.filter(is_superuser=True).exclude(username='admin').select_related('profile_pic')
     
 class UserDetailAPIView(RetrieveAPIView):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile_pic')
     serializer_class = UserSerializer
     lookup_field = 'id'
     permission_classes = [IsAuthenticated]  # Use AllowAny if public access is needed
@@ -233,56 +216,88 @@ def create_chat_room_and_send_message(request, receiver_id):
     except User.DoesNotExist:
         return Response({'error': 'Receiver does not exist.'}, status=status.HTTP_404_NOT_FOUND)
 
-    existing_chat_rooms = ChatRoom.objects.filter(users=sender).filter(users=receiver)
-
-    if existing_chat_rooms.exists():
-        chat_room = existing_chat_rooms.first()
-    else:
-        chat_room = ChatRoom.objects.create()
-        chat_room.users.add(sender, receiver)
-
     message_data = {
-        'chat_room': chat_room.id,
         'sender': sender.id,
         'content': content
     }
-    message_serializer = MessageSerializer(data=message_data)
 
-    if message_serializer.is_valid():
-        message_serializer.save()
-        return Response({
-            'chat_room': ChatRoomSerializer(chat_room).data,
-            'message': message_serializer.data
-        }, status=status.HTTP_201_CREATED)
-    else:
-        return Response(message_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    # The message and the room's last-message summary and unread counts are written together
+    with transaction.atomic():
+        chat_room, _ = get_or_create_direct_room(sender, receiver)
+
+        message_data['chat_room'] = chat_room.id
+        message_serializer = MessageSerializer(data=message_data)
+
+        if not message_serializer.is_valid():
+            return Response(message_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        message = message_serializer.save()
+        record_message(message)
+        prefetch_related_objects([chat_room], ROOM_USERS)
+        transaction.on_commit(lambda: publish_message(message, {sender.id, receiver.id}))
+
+    return Response({
+        'chat_room': ChatRoomSerializer(chat_room).data,
+        'message': message_serializer.data
+    }, status=status.HTTP_201_CREATED)
     
     
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def send_bulk_message(request):
+    """Send the same message to many users from an advisor, each in their direct room.
+
+    Takes {"receiver_ids": [...], "content": "..."} and returns one result per
+    receiver. The work is a fixed number of batched queries, whatever the number of receivers.
+    """
+    sender = request.user
+    if not sender.is_superuser:
+        return Response({'error': 'Only advisors can send bulk messages.'}, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = BulkMessageSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    receiver_ids = serializer.validated_data['receiver_ids']
+    content = serializer.validated_data['content']
+
+    existing = set(User.objects.filter(id__in=receiver_ids).values_list('id', flat=True))
+    recipients = [receiver_id for receiver_id in receiver_ids if receiver_id in existing and receiver_id != sender.id]
+
+    with transaction.atomic():
+        room_ids = get_or_create_direct_rooms(sender.id, recipients)
+        messages = Message.objects.bulk_create(
+            [Message(chat_room_id=room_ids[receiver_id], sender=sender, content=content) for receiver_id in recipients],
+            batch_size=500,
+        )
+        record_messages(messages)
+
+        deliveries = [(message, {sender.id, receiver_id}) for receiver_id, message in zip(recipients, messages)]
+        transaction.on_commit(lambda: publish_messages(deliveries))
+
+    sent = dict(zip(recipients, messages))
+    results = []
+    for receiver_id in receiver_ids:
+        if receiver_id in sent:
+            message = sent[receiver_id]
+            results.append({'receiver_id': receiver_id, 'status': 'sent', 'chat_room_id': message.chat_room_id, 'message_id': message.id})
+        elif receiver_id == sender.id:
+            results.append({'receiver_id': receiver_id, 'status': 'skipped', 'error': 'Cannot send a message to yourself.'})
+        else:
+            results.append({'receiver_id': receiver_id, 'status': 'not_found', 'error': 'Receiver does not exist.'})
+
+    return Response({'sent': len(sent), 'results': results}, status=status.HTTP_201_CREATED)
+
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_chat_rooms_for_logged_in_user(request):
 
     user = request.user
 
-    chat_rooms = ChatRoom.objects.filter(users=user)
-    
-    data = []
-    for room in chat_rooms:
-        other_users = room.users.exclude(id=user.id)
-        latest_message = Message.objects.filter(chat_room=room).order_by('-timestamp').first()
-        latest_message_content = latest_message.content if latest_message else "No messages yet"
-        latest_message_timestamp = latest_message.timestamp if latest_message else None
-        
-        room_data = {
-            'id': room.id,
-            'other_users': [{'id': other_user.id, 'first_name': other_user.first_name, 'username': other_user.username} for other_user in other_users],
-            'latest_message': latest_message_content,
-            'timestamp': latest_message_timestamp
-        }
-        data.append(room_data)
-
-    return Response(data, status=status.HTTP_200_OK)
+    # See inbox_page_query for the optional limit/cursor paging
+    chat_rooms, limit = inbox_page_query(inbox_queryset(user), request.query_params)
+    return Response(inbox_page(chat_rooms, limit), status=status.HTTP_200_OK)
 
 
 
@@ -294,35 +309,23 @@ class ChatRoomView(generics.ListAPIView):
         other_user_id = self.kwargs['other_user_id']
         current_user_id = self.kwargs['current_user_id']
 
-        other_user = get_object_or_404(User, id=other_user_id)
-        current_user = get_object_or_404(User, id=current_user_id)
-
-        chat_rooms = ChatRoom.objects.filter(users__in=[current_user, other_user]).distinct()
+        user_ids = {other_user_id, current_user_id}
+        if User.objects.filter(id__in=user_ids).count() != len(user_ids):
+            raise Http404
 
-        chat_rooms = [chat_room for chat_room in chat_rooms if 
-                      chat_room.users.filter(id=current_user_id).exists() and
-                      chat_room.users.filter(id=other_user_id).exists()]
-        
-        return chat_rooms
+        return find_direct_room(current_user_id, other_user_id)
 
     def list(self, request, *args, **kwargs):
         chat_rooms = self.get_queryset()
         chat_room_data = []
         for chat_room in chat_rooms:
-            chat_room_serializer = ChatRoomSerializer(chat_room)
-            chat_room_id = chat_room_serializer.data['id']
-            print(f"Chat Room ID: {chat_room_id}")
-            
-            # Get messages for the chat room
-            messages = Message.objects.filter(chat_room=chat_room_id).order_by('timestamp')
-            print(f"Messages: {messages}")
-            
-            message_serializer = MessageSerializer(messages, many=True)
-            
-            chat_room_data.append({
-                'chat_room_id': chat_room_id,
-                'messages': message_serializer.data
-            })
+            # One page of messages per room; see message_history_query for the paging parameters
+            messages, limit, forward = message_history_query(chat_room.id, request.query_params)
+            chat_room_data.append(message_history_page(chat_room.id, messages, limit, forward))
+
+            # Fetching the history as the current user counts as reading it
+            if request.user.is_authenticated and request.user.id == self.kwargs['current_user_id']:
+                mark_read(chat_room.id, request.user.id)
 
         return Response(chat_room_data, status=status.HTTP_200_OK)
     
@@ -336,14 +339,14 @@ class QuizCreateView(generics.CreateAPIView):
         
 
 
-class QuizListView(generics.ListAPIView):
-    queryset = Quiz.objects.all() 
+class QuizListView(QuizCatalogueMixin, generics.ListAPIView):
+    queryset = Quiz.objects.select_related('provider', 'provider__profile_pic')
     serializer_class = QuizSerializer
     permission_classes = [AllowAny]
     
 
 class QuizDetailView(RetrieveAPIView):
-    queryset = Quiz.objects.all()
+    queryset = Quiz.objects.select_related('provider', 'provider__profile_pic')
     serializer_class = QuizSerializer
     lookup_field = 'id'
     
@@ -352,30 +355,37 @@ class SubmitQuizAnswerView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, quiz_id):
-        try:
-            quiz = Quiz.objects.get(id=quiz_id)
-        except Quiz.DoesNotExist:
-            return Response({"error": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        if UserQuiz.objects.filter(user=request.user, quiz=quiz).exists():
-            return Response({"error": "You have already submitted an answer for this quiz."}, status=status.HTTP_400_BAD_REQUEST)
-
-        data = {
-            'user': request.user.id,  # User ID
-            'quiz': quiz.id,          # Quiz ID
+        serializer = QuizSubmissionSerializer(data={
             'answer': request.data.get('answer'),
             'status': request.data.get('status', False),
             'score': request.data.get('score', 0),
             'comment': request.data.get('comment', '')
-        }
-
-        serializer = UserQuizSerializer(data=data, context={'request': request})
-        if serializer.is_valid():
-            user_quiz = serializer.save(user=request.user, quiz=quiz)
-            return Response(UserQuizSerializer(user_quiz).data, status=status.HTTP_201_CREATED)
-        else:
-            print("Serializer errors:", serializer.errors)
+        })
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Checked up front: SQLite defers foreign key checks to the outermost commit, which may
+        # be a caller's transaction (ATOMIC_REQUESTS, tests) rather than the block below
+        if not Quiz.objects.filter(pk=quiz_id).exists():
+            return Response({"error": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Insert and let unique_together (user, quiz) settle concurrent submits; no lookup beforehand
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        try:
+            with transaction.atomic():
+                user_quiz = UserQuiz.objects.create(
+                    user=request.user, quiz_id=quiz_id, idempotency_key=idempotency_key, **serializer.validated_data,
+                )
+        except IntegrityError:
+            user_quiz = UserQuiz.objects.filter(user=request.user, quiz_id=quiz_id).first()
+            if user_quiz is None:
+                # The quiz was deleted since the check above
+                return Response({"error": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND)
+            if idempotency_key is None or user_quiz.idempotency_key != idempotency_key:
+                return Response({"error": "You have already submitted an answer for this quiz."}, status=status.HTTP_400_BAD_REQUEST)
+            # A retry of the submission that went through: replay its result
+
+        return Response(UserQuizSerializer(user_quiz).data, status=status.HTTP_201_CREATED)
         
 
 class CheckQuizStatusView(APIView):
@@ -404,24 +414,100 @@ class CheckQuizStatusView(APIView):
             "comment": ""
         }, status=status.HTTP_200_OK)
         
-class QuizByProviderView(generics.ListAPIView):
+class QuizStatusListView(APIView):
+    """The user's status for every quiz they have taken, or for `?ids=1,2,3`, in one query."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        quiz_ids = None
+        if request.query_params.get('ids'):
+            serializer = QuizStatusQuerySerializer(data={'ids': request.query_params['ids'].split(',')})
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            quiz_ids = serializer.validated_data['ids']
+
+        return Response(user_quiz_statuses(request.user, quiz_ids), status=status.HTTP_200_OK)
+        
+class QuizByProviderView(QuizCatalogueMixin, generics.ListAPIView):
     serializer_class = QuizSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         provider_id = self.kwargs.get('provider_id')
-        return Quiz.objects.filter(provider_id=provider_id)
+        return Quiz.objects.filter(provider_id=provider_id).select_related('provider', 'provider__profile_pic')
     
 class UserQuizListView(generics.ListAPIView):
     serializer_class = UserQuizDetailSerializer
 
     def get_queryset(self):
         quiz_id = self.kwargs['quiz_id']
-        return UserQuiz.objects.filter(quiz_id=quiz_id, status="already_taken")
+        return UserQuiz.objects.filter(quiz_id=quiz_id, status="already_taken").select_related('user', 'user__profile_pic')
+
+
+class BulkGradeView(APIView):
+    """Grade many submissions at once: {"updates": [{"id", "score", "status", "comment"}, ...]}.
+
+    Every submission must belong to a quiz of the caller; nothing is saved unless
+    all of them do. One query loads and checks the rows, one bulk_update saves them.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkGradeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        updates = {update.pop('id'): update for update in serializer.validated_data['updates']}
+
+        with transaction.atomic():
+            user_quizzes = list(
+                UserQuiz.objects.select_for_update(of=('self',))
+                .filter(id__in=updates)
+                .select_related('quiz')
+                .only('id', 'user_id', 'quiz_id', 'answer', 'status', 'score', 'created_at', 'comment', 'quiz__provider_id')
+            )
+            missing = sorted(set(updates) - {user_quiz.id for user_quiz in user_quizzes})
+            if missing:
+                return Response({"error": "Submissions not found.", "ids": missing}, status=status.HTTP_404_NOT_FOUND)
+            forbidden = sorted(user_quiz.id for user_quiz in user_quizzes if user_quiz.quiz.provider_id != request.user.id)
+            if forbidden:
+                return Response({"error": "You can only grade submissions to your own quizzes.", "ids": forbidden}, status=status.HTTP_403_FORBIDDEN)
+
+            fields = set()
+            for user_quiz in user_quizzes:
+                for field, value in updates[user_quiz.id].items():
+                    setattr(user_quiz, field, value)
+                    fields.add(field)
+            UserQuiz.objects.bulk_update(user_quizzes, sorted(fields), batch_size=500)
+
+        return Response({
+            'updated': len(user_quizzes),
+            'results': UserQuizSerializer(user_quizzes, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+class QuizResultsExportView(APIView):
+    """Stream the results of one of the caller's quizzes as CSV or JSON Lines."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, quiz_id, export_format):
+        provider_id = Quiz.objects.filter(id=quiz_id).values_list('provider_id', flat=True).first()
+        if provider_id is None:
+            return Response({"error": "Quiz not found."}, status=status.HTTP_404_NOT_FOUND)
+        if provider_id != request.user.id:
+            return Response({"error": "You can only export results of your own quizzes."}, status=status.HTTP_403_FORBIDDEN)
+
+        write_rows, content_type = EXPORT_FORMATS[export_format]
+        lines = write_rows(quiz_result_rows(quiz_id))
+        if isinstance(request._request, ASGIRequest):
+            # A sync iterator would be buffered whole under ASGI
+            lines = astream(lines)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="quiz-{quiz_id}-results.{export_format}"'
+        return response
 
 
 class UserQuizUpdateView(UpdateAPIView):
-    queryset = UserQuiz.objects.all()
+    queryset = UserQuiz.objects.select_related('user', 'user__profile_pic')
     serializer_class = UserQuizDetailSerializer
 
     def update(self, request, *args, **kwargs):
@@ -0,0 +1,30 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+
+@database_sync_to_async
+def _get_user(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, TokenError):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Sets scope['user'] from the same JWT access token the REST API uses.
+
+    Browsers cannot set headers on a WebSocket handshake, so the token comes
+    from the `token` query string parameter.
+    """
+
+    async def __call__(self, scope, receive, send):
+        tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        scope = dict(scope, user=await _get_user(tokens[0]) if tokens else AnonymousUser())
+        return await super().__call__(scope, receive, send)
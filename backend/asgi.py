@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+# Set up Django before anything imports models
+django_asgi_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+
+from api.routing import websocket_urlpatterns  # noqa: E402
+from api.ws_auth import JWTAuthMiddleware  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_application,
+    'websocket': JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+})
+
+from api.chatbot.conf import chatbot_setting  # noqa: E402
+
+if chatbot_setting('CHATBOT_PRELOAD_ENCODER'):
+    from api.chatbot.encoder import preload  # noqa: E402
+
+    preload()
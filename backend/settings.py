@@ -55,6 +55,7 @@ INSTALLED_APPS = [
     'api',
     'rest_framework',
     'corsheaders', 
+    'channels',
 ]
 
 MIDDLEWARE = [
@@ -87,6 +88,23 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# WebSocket fan-out. The in-memory layer only reaches clients connected to the same process;
+# set CHANNEL_REDIS_URL to share one broker between several ASGI processes or nodes.
+if os.environ.get('CHANNEL_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['CHANNEL_REDIS_URL']]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
 
 
 # Database
@@ -144,4 +162,10 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+
+# Chatbot (see api/chatbot/conf.py for every setting and its default)
+# Set CHATBOT_PRELOAD_ENCODER and CHATBOT_FORK_FRIENDLY when serving with `gunicorn --preload`
+# so the master loads the model once and the forked workers share it.
+CHATBOT_PRELOAD_ENCODER = False
+CHATBOT_FORK_FRIENDLY = False
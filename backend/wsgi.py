@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+from api.chatbot.conf import chatbot_setting  # noqa: E402
+
+if chatbot_setting('CHATBOT_PRELOAD_ENCODER'):
+    from api.chatbot.encoder import preload  # noqa: E402
+
+    preload()